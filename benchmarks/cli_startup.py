@@ -0,0 +1,85 @@
+"""
+Startup budget of the 'dbserv' command line (cli.py).
+
+Runs each command below in a fresh interpreter several times and compares the median
+wall time with its budget. It also checks that none of the heavy libraries was imported,
+since a stray module-level 'import pandas' is what usually breaks the budget.
+Exits with 1 when a command is over budget.
+
+        python benchmarks/cli_startup.py [--runs N]
+"""
+
+import sys
+import json
+import time
+import statistics
+import subprocess
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# Command line -> seconds (median, interpreter start included)
+BUDGETS = {
+    ("--help",): 0.10,
+    ("upload", "--help"): 0.10,
+    ("export", "--help"): 0.10,
+    ("list",): 0.30,
+}
+HEAVY_MODULES = ("pandas", "numpy", "openpyxl", "pyarrow")
+
+# Runs one command in-process and reports which heavy modules it pulled in
+_PROBE = """
+import sys, json, contextlib, io
+import cli
+with contextlib.redirect_stdout(io.StringIO()):
+    cli.main(json.loads(sys.argv[1]))
+print(json.dumps([m for m in json.loads(sys.argv[2]) if m in sys.modules]))
+"""
+
+
+def _timed(command):
+    start = time.perf_counter()
+    subprocess.run(command, cwd=BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+    return time.perf_counter() - start
+
+
+def time_command(args, runs):
+    """Median seconds of 'python cli.py <args>' over 'runs' fresh processes."""
+    return statistics.median(_timed([sys.executable, str(BASE_DIR / "cli.py"), *args]) for _ in range(runs))
+
+
+def heavy_imports(args):
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE, json.dumps(list(args)), json.dumps(HEAVY_MODULES)],
+        cwd=BASE_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    argv = sys.argv[1:]
+    runs = int(argv[argv.index("--runs") + 1]) if "--runs" in argv else 5
+
+    # Bare interpreter start, for reference
+    baseline = statistics.median(_timed([sys.executable, "-c", "pass"]) for _ in range(runs))
+    print(f"\n=== ⏱️ CLI STARTUP (median of {runs}, python alone {baseline * 1000:.0f} ms) ===")
+    failed = False
+    for args, budget in BUDGETS.items():
+        seconds = time_command(args, runs)
+        heavy = heavy_imports(args)
+        ok = seconds <= budget and not heavy
+        failed |= not ok
+        note = f"  imports {', '.join(heavy)}" if heavy else ""
+        print(
+            f"{'✅' if ok else '❌'} dbserv {' '.join(args):<16} "
+            f"{seconds * 1000:>6.0f} ms (budget {budget * 1000:.0f} ms){note}"
+        )
+    print("=" * 30 + "\n")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,457 @@
+"""
+Benchmarks for the ingestion, CRUD and export paths.
+
+Starts a throwaway local PostgreSQL (initdb/pg_ctl must be on PATH or found through
+pg_config) unless a DSN is given with --dsn or BENCH_DSN. The cases drop and truncate the
+EBA and demo tables, so a DSN must name a dedicated database ('bench' or 'bench_*')
+unless --allow-destructive is passed. For every scale it generates
+a synthetic EBA-shaped workbook (same sheet and columns as EBA_series_julian.xlsx) plus
+the matching YAML tree and demo_series rows, then times each path in a fresh process and
+records rows/sec, round trips and peak RSS. Results are written as JSON so runs can be
+compared.
+
+        python benchmarks/run_benchmarks.py [--scales 1k,100k,1m] [--dsn postgresql://...]
+                                            [--allow-destructive]
+        python benchmarks/run_benchmarks.py --compare results/old.json results/new.json
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import socket
+import platform
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+sys.path.append(str(BASE_DIR))
+
+SCALES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+COUNTRIES = ["DE", "ES", "EU", "FR", "IT"]
+SHEET_NAME = "KRIs_by_country_and_EU"
+# Tables dropped before every EBA case (CASCADE also removes the aggregate views)
+EBA_TABLES = [
+    "values", "metrics", "hierarchy", "schema_migrations",
+    "deleted_rows", "upload_checkpoints", "change_watermarks",
+]
+
+
+def is_bench_database(dbname):
+    """Only databases named like this are reset without --allow-destructive."""
+    return dbname == "bench" or dbname.startswith("bench_")
+
+
+# --- throwaway server ---------------------------------------------------------------
+def _pg_bindir():
+    if shutil.which("initdb"):
+        return Path(shutil.which("initdb")).parent
+    if shutil.which("pg_config"):
+        output = subprocess.run(["pg_config", "--bindir"], capture_output=True, text=True)
+        return Path(output.stdout.strip())
+    raise RuntimeError("No PostgreSQL binaries found: install them or pass --dsn / BENCH_DSN")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_local_server(work_dir):
+    """initdb + pg_ctl start on a unix socket inside work_dir. Returns connection settings."""
+    bindir = _pg_bindir()
+    data_dir = work_dir / "pgdata"
+    port = _free_port()
+    subprocess.run(
+        [bindir / "initdb", "-D", data_dir, "-U", "postgres", "--auth=trust"],
+        check=True,
+        capture_output=True,
+    )
+    subprocess.run(
+        [
+            bindir / "pg_ctl", "-D", data_dir, "-w", "-l", work_dir / "postgres.log",
+            "-o", f"-p {port} -k {work_dir} -c listen_addresses='' -c fsync=off",
+            "start",
+        ],
+        check=True,
+        capture_output=True,
+    )
+    subprocess.run(
+        [bindir / "createdb", "-h", work_dir, "-p", str(port), "-U", "postgres", "bench"],
+        check=True,
+        capture_output=True,
+    )
+    settings = {"host": str(work_dir), "port": port, "user": "postgres", "dbname": "bench", "password": ""}
+    return settings, lambda: subprocess.run(
+        [bindir / "pg_ctl", "-D", data_dir, "-m", "fast", "stop"], capture_output=True
+    )
+
+
+def write_bench_config(settings, work_dir):
+    """Writes a database.yaml for the benchmark server and points the package at it."""
+    config_path = work_dir / "database.yaml"
+    config = {
+        "engine": "postgresql",
+        "username": settings["user"],
+        "host": settings["host"],
+        "database": settings["dbname"],
+        "port": int(settings.get("port") or 5432),
+        "password_env": "BENCH_DB_PASSWORD",
+        "pool": {"min_size": 1, "max_size": 4, "max_idle_seconds": 300},
+    }
+    import yaml
+
+    with open(config_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f)
+    os.environ["DB_CONFIG_PATH"] = str(config_path)
+    os.environ["BENCH_DB_PASSWORD"] = settings.get("password") or ""
+    return config_path
+
+
+# --- synthetic data -----------------------------------------------------------------
+def dataset_shape(rows):
+    """(categories, periods) so that categories * len(COUNTRIES) * periods ~= rows."""
+    periods = max(1, min(600, rows // (len(COUNTRIES) * 2)))
+    categories = max(1, math.ceil(rows / (len(COUNTRIES) * periods)))
+    return categories, periods
+
+
+def generate_dataset(rows, work_dir):
+    """Writes an EBA-shaped workbook and YAML tree for ~rows values. Returns their paths."""
+    import numpy as np
+    import pandas as pd
+    import yaml
+
+    categories, periods = dataset_shape(rows)
+    names = [f"Metric_{i:04d}" for i in range(categories)]
+    months = pd.period_range("1970-01", periods=periods, freq="M")
+    periodo = [int(m.strftime("%Y%m")) for m in months]
+
+    grid = pd.MultiIndex.from_product(
+        [periodo, COUNTRIES, names], names=["periodo", "pais", "metric"]
+    ).to_frame(index=False)
+    grid["[Number]"] = grid["metric"]
+    grid["nombre"] = grid["metric"]
+    grid["valor"] = np.random.default_rng(42).random(len(grid))
+    grid = grid[["periodo", "pais", "[Number]", "nombre", "valor", "metric"]]
+
+    workbook = work_dir / f"bench_{rows}.xlsx"
+    grid.to_excel(workbook, sheet_name=SHEET_NAME, index=False)
+
+    tree = {
+        "EBA_Metrics": {
+            name: {f"EBA.{name}.{country}": country for country in COUNTRIES} for name in names
+        }
+    }
+    yaml_path = work_dir / f"bench_{rows}.yaml"
+    with open(yaml_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(tree, f, allow_unicode=True)
+    return {"workbook": str(workbook), "yaml": str(yaml_path), "values": len(grid)}
+
+
+def demo_rows(count, offset=0):
+    return [
+        (f"Bench series {i}", "Drama", i % 12 + 1, round((i % 100) / 10, 1), 1950 + i % 75)
+        for i in range(offset, offset + count)
+    ]
+
+
+# --- cases (each runs in its own process) ---------------------------------------------
+def _prepare(name, dataset, per_row_limit):
+    """
+    Does the untimed setup of one case and returns (callable, rows): the callable is the
+    work that gets timed, rows is how many values/records it processes.
+    """
+    import yaml
+    import pandas as pd
+    from database.connection import pooled_connection
+    from database import operations
+    from series_EBA.series_hierarchy_metric_EBA import create_eba_schema, sync_hierarchy
+    from series_EBA.upload_series_EBA import bulk_upload_values, upload_values
+
+    with open(dataset["yaml"], "r", encoding="utf-8") as f:
+        tree = yaml.safe_load(f)
+    values = dataset["values"]
+    per_row = min(values, per_row_limit)
+    metrics = sum(len(section) for section in tree["EBA_Metrics"].values())
+
+    def read_sheet():
+        return pd.read_excel(dataset["workbook"], sheet_name=SHEET_NAME)
+
+    def in_transaction(fn):
+        def run():
+            with pooled_connection() as (conn, cur):
+                fn(cur)
+                conn.commit()
+
+        return run
+
+    def reset_eba(schema=True, with_values=False):
+        with pooled_connection() as (conn, cur):
+            cur.execute(f"DROP TABLE IF EXISTS {', '.join(EBA_TABLES)} CASCADE;")
+            if schema:
+                create_eba_schema(cur)
+                sync_hierarchy(cur, tree)
+            if with_values:
+                bulk_upload_values(read_sheet(), cur)
+            conn.commit()
+
+    def reset_demo(rows=0):
+        operations.initialize_table()
+        with pooled_connection() as (conn, cur):
+            cur.execute("TRUNCATE demo_series RESTART IDENTITY;")
+            conn.commit()
+        if rows:
+            operations.insert_series_batch(demo_rows(rows))
+
+    def export(fmt):
+        from exports.writers import write_frame, frame_from_cursor
+
+        def run():
+            with pooled_connection() as (conn, cur):
+                cur.execute("SELECT * FROM values;")
+                df_out = frame_from_cursor(cur.fetchall(), cur.description)
+            write_frame(df_out, Path(dataset["workbook"]).with_name(f"export_{values}"), fmt=fmt)
+
+        return run
+
+    def export_stream():
+        from exports.export_to_excel_custom import stream_table_to_excel
+
+        # Pooled (instrumented) connection, so the stream's statements are recorded too
+        with pooled_connection() as (conn, cur):
+            out = Path(dataset["workbook"]).with_name(f"export_stream_{values}.xlsx")
+            stream_table_to_excel(conn, "values", out)
+
+    if name == "read_excel":
+        return read_sheet, values
+
+    if name == "sync_hierarchy_cold":
+        reset_eba(schema=False)
+        return in_transaction(lambda cur: (create_eba_schema(cur), sync_hierarchy(cur, tree))), metrics
+
+    if name == "sync_hierarchy_warm":
+        reset_eba()
+        return in_transaction(lambda cur: sync_hierarchy(cur, tree)), metrics
+
+    if name in ("upload_bulk", "upload_bulk_rerun", "upload_row_by_row"):
+        reset_eba(with_values=name == "upload_bulk_rerun")
+        df = read_sheet()
+        if name != "upload_row_by_row":
+            return in_transaction(lambda cur: bulk_upload_values(df, cur)), len(df)
+
+        df = df.iloc[:per_row]
+        indexed = df.set_index(["periodo", "pais", "metric"])
+
+        def row_by_row(cur):
+            for p in indexed.index.get_level_values("periodo").unique():
+                upload_values(indexed.loc[p], cur, tree, datetime.strptime(str(p), "%Y%m").date())
+
+        return in_transaction(row_by_row), len(df)
+
+    if name == "insert_series":
+        reset_demo()
+        rows = demo_rows(per_row)
+        return lambda: operations.insert_series(rows), per_row
+
+    if name == "insert_series_batch":
+        reset_demo()
+        rows = demo_rows(values)
+        return lambda: operations.insert_series_batch(rows), values
+
+    if name in ("bulk_update", "bulk_update_batch"):
+        count = per_row if name == "bulk_update" else values
+        reset_demo(count)
+        updates = [("Netflix", title) for title, *_ in demo_rows(count)]
+        helper = operations.bulk_update if name == "bulk_update" else operations.bulk_update_batch
+        return lambda: helper(updates), count
+
+    if name.startswith("export"):
+        reset_eba(with_values=True)
+        if name == "export_xlsx_stream":
+            return export_stream, values
+        return export({"export_xlsx": "xlsx", "export_csv_gz": "csv.gz", "export_parquet": "parquet"}[name]), values
+
+    raise ValueError(f"Unknown case '{name}'")
+
+
+def run_case(name, dataset, per_row_limit):
+    """Entry point of the child process: prepares, times and measures one case."""
+    from database.instrumentation import enable_instrumentation
+
+    try:
+        fn, rows = _prepare(name, dataset, per_row_limit)
+        # A fresh recorder so only the timed work is counted
+        recorder = enable_instrumentation()
+        start = time.perf_counter()
+        fn()
+        seconds = time.perf_counter() - start
+    except Exception as e:
+        return {"case": name, "error": f"{type(e).__name__}: {e}"}
+
+    statements = recorder.memory.summary()["statements"].values()
+
+    return {
+        "case": name,
+        "rows": rows,
+        "seconds": round(seconds, 4),
+        "rows_per_sec": round(rows / seconds, 1) if seconds else None,
+        "round_trips": sum(s["calls"] for s in statements),
+        "db_seconds": round(sum(s["seconds"] for s in statements), 4),
+        # ru_maxrss is in KiB on Linux; setup shares the process, so this is an upper bound
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+CASES = [
+    "read_excel",
+    "sync_hierarchy_cold",
+    "sync_hierarchy_warm",
+    "upload_bulk",
+    "upload_bulk_rerun",
+    "upload_row_by_row",
+    "insert_series",
+    "insert_series_batch",
+    "bulk_update",
+    "bulk_update_batch",
+    "export_xlsx",
+    "export_xlsx_stream",
+    "export_csv_gz",
+    "export_parquet",
+]
+
+
+# --- runner -------------------------------------------------------------------------
+def run_benchmarks(
+    scales, dsn=None, per_row_limit=10_000, cases=None, output=None, allow_destructive=False
+):
+    settings = None
+    if dsn:
+        import psycopg2.extensions
+
+        parsed = psycopg2.extensions.parse_dsn(dsn)
+        settings = {
+            "host": parsed.get("host", "localhost"),
+            "port": parsed.get("port", 5432),
+            "user": parsed.get("user", "postgres"),
+            "dbname": parsed.get("dbname", "postgres"),
+            "password": parsed.get("password", ""),
+        }
+        if not (is_bench_database(settings["dbname"]) or allow_destructive):
+            raise RuntimeError(
+                f"Refusing to run against '{settings['dbname']}': the benchmarks drop and "
+                "truncate tables. Use a dedicated 'bench' / 'bench_*' database or pass "
+                "--allow-destructive."
+            )
+
+    work_dir = Path(tempfile.mkdtemp(prefix="bench_"))
+    stop_server = None
+    try:
+        if not settings:
+            print("🐘 Starting a throwaway PostgreSQL...")
+            settings, stop_server = start_local_server(work_dir)
+        write_bench_config(settings, work_dir)
+
+        results = []
+        context = multiprocessing.get_context("spawn")
+        for label in scales:
+            print(f"🧪 Generating dataset '{label}'...")
+            dataset = generate_dataset(SCALES[label], work_dir)
+            for name in cases or CASES:
+                # A fresh process per case keeps peak RSS and pools independent
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    result = pool.submit(run_case, name, dataset, per_row_limit).result()
+                result["scale"] = label
+                results.append(result)
+                if "error" in result:
+                    print(f"   ❌ {name}: {result['error']}")
+                else:
+                    print(
+                        f"   ⏱️ {name}: {result['seconds']:.3f}s, {result['rows_per_sec']:,} rows/s, "
+                        f"{result['round_trips']} round trips, {result['peak_rss_mb']} MB"
+                    )
+
+        report = {
+            "started": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.platform(),
+            "server": "dsn" if dsn else "local",
+            "per_row_limit": per_row_limit,
+            "results": results,
+        }
+        RESULTS_DIR.mkdir(exist_ok=True)
+        output = Path(output) if output else RESULTS_DIR / f"bench_{datetime.now():%Y%m%d_%H%M%S}.json"
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Results written to {output}")
+        return report
+    finally:
+        if stop_server:
+            stop_server()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def compare(old_path, new_path):
+    """Prints the seconds of two result files side by side (ratio < 1 means faster)."""
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = {(r["case"], r["scale"]): r for r in json.load(f)["results"] if "error" not in r}
+    with open(new_path, "r", encoding="utf-8") as f:
+        new = {(r["case"], r["scale"]): r for r in json.load(f)["results"] if "error" not in r}
+
+    print(f"{'case':<22}{'scale':>6}{'old s':>10}{'new s':>10}{'ratio':>8}")
+    for key in sorted(old.keys() & new.keys()):
+        before, after = old[key]["seconds"], new[key]["seconds"]
+        ratio = after / before if before else float("nan")
+        print(f"{key[0]:<22}{key[1]:>6}{before:>10.3f}{after:>10.3f}{ratio:>8.2f}")
+
+
+def _option(argv, flag, default=None):
+    if flag in argv and argv.index(flag) + 1 < len(argv):
+        return argv[argv.index(flag) + 1]
+    return default
+
+
+def main():
+    argv = sys.argv[1:]
+    if "--compare" in argv:
+        index = argv.index("--compare")
+        compare(argv[index + 1], argv[index + 2])
+        return
+
+    scales = _option(argv, "--scales", ",".join(SCALES)).lower().split(",")
+    unknown = [s for s in scales if s not in SCALES]
+    if unknown:
+        print(f"Unknown scale(s): {', '.join(unknown)}. Choose from: {', '.join(SCALES)}")
+        return 1
+    cases = _option(argv, "--cases")
+    try:
+        report = run_benchmarks(
+            scales,
+            dsn=_option(argv, "--dsn", os.getenv("BENCH_DSN")),
+            per_row_limit=int(_option(argv, "--per-row-limit", 10_000)),
+            cases=cases.split(",") if cases else None,
+            output=_option(argv, "--output"),
+            allow_destructive="--allow-destructive" in argv,
+        )
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+    # A failing case fails the run (the results file still lists every case)
+    failed = [r["case"] for r in report["results"] if "error" in r]
+    if failed:
+        print(f"❌ {len(failed)} case(s) failed: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
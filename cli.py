@@ -0,0 +1,173 @@
+"""
+Command line entry point for the project's scripts (installed as the 'dbserv' console script).
+
+        dbserv list [--server]
+        dbserv sync-hierarchy [target_db] [--partitioned] [--aggregate-views]
+        dbserv upload [target_db] [--incremental] [--check-changes] [--dry-run] [--chunk period|N]
+        dbserv ingest [target_db] [--source <dir or glob>] [--workers N] [--batch-size N]
+        dbserv export [<target_db> <table>] [--format xlsx|parquet|feather|csv.gz] [--stream] [--incremental]
+        dbserv export-batch [jobs.yaml] [database:table ...] [--workers N] [--max-per-db N]
+
+Only the standard library is imported at startup: every command imports what it needs
+(pandas, NumPy, openpyxl, psycopg2) when it runs, so '--help', 'list' and cron runs don't
+pay for libraries they never use. benchmarks/cli_startup.py checks the startup budget.
+"""
+
+import sys
+import textwrap
+
+
+# 1. Commands (each one receives the arguments after its name)
+def cmd_list(argv):
+    """
+    dbserv list             Profiles in config/database.yaml (no connection is opened)
+    dbserv list --server    Databases and tables on the server, with row estimates and sizes
+    """
+    if "--server" in argv:
+        from exports.export_to_excel_custom import list_server_contents
+
+        list_server_contents()
+        return 0
+
+    from database.connection import get_db_config, list_profiles
+
+    print("\n=== 🗂️ DATABASE PROFILES ===")
+    for name in [None] + list_profiles():
+        config = get_db_config(name)
+        print(f"📁 {name or '(default)'}: {config.dbname} @ {config.host}:{config.port}")
+    print("=" * 30 + "\n")
+    return 0
+
+
+def cmd_sync_hierarchy(argv):
+    """
+    dbserv sync-hierarchy [target_db] [--partitioned] [--aggregate-views]
+
+    Creates the EBA schema and syncs the hierarchy and metrics from estructura_EBA.yaml.
+    """
+    from series_EBA.series_hierarchy_metric_EBA import run_setup
+
+    return run_setup(argv)
+
+
+def cmd_upload(argv):
+    """
+    dbserv upload [target_db] [--incremental] [--check-changes] [--dry-run] [--no-cache]
+                  [--chunk period|N] [--row-by-row]
+
+    Uploads the values of EBA_series_julian.xlsx (see series_EBA/upload_series_EBA.py).
+    """
+    from series_EBA.upload_series_EBA import main as upload_main
+
+    return upload_main(argv)
+
+
+def cmd_ingest(argv):
+    """
+    dbserv ingest [target_db] [--source <dir or glob>] [--workers N] [--batch-size N]
+
+    Parses several workbooks in parallel and loads their values (series_EBA/ingest_workbooks_EBA.py).
+    """
+    from series_EBA.ingest_workbooks_EBA import main as ingest_main
+
+    return ingest_main(argv)
+
+
+def cmd_export(argv):
+    """
+    dbserv export [--format xlsx|parquet|feather|csv.gz]
+        demo_series of the default database
+    dbserv export <target_db> <table> [--format xlsx|parquet|feather|csv.gz] [--stream]
+        One table, without prompts (--stream writes large tables to Excel in bounded memory)
+
+    --incremental exports only the rows changed since the previous --incremental export
+    (and the keys of deleted rows), then records the new watermark.
+    """
+    from exports.writers import parse_format_arg, resolve_format
+
+    fmt = resolve_format(parse_format_arg(argv))
+    args = [a for i, a in enumerate(argv) if not a.startswith("--") and argv[i - 1 : i] != ["--format"]]
+
+    if len(args) == 1:
+        print("❌ Export needs both a database and a table (or neither for demo_series).")
+        return 2
+    if args:
+        from exports.export_to_excel_custom import export_custom_table
+
+        return export_custom_table(
+            stream="--stream" in argv,
+            fmt=fmt,
+            target_db=args[0],
+            target_table=args[1],
+            incremental="--incremental" in argv,
+        )
+    if "--incremental" in argv:
+        from exports.export_to_excel_current import export_changes
+
+        export_changes(fmt=fmt)
+    else:
+        from exports.export_to_excel_current import export_database_to_excel
+
+        export_database_to_excel(fmt=fmt)
+    return 0
+
+
+def cmd_export_batch(argv):
+    """
+    dbserv export-batch [jobs.yaml] [database:table ...] [--format F] [--incremental]
+                        [--workers N] [--max-per-db N] [--output-dir DIR]
+
+    Runs the export jobs of config/export_jobs.yaml (or the given spec / targets) in parallel,
+    writes every file atomically and a JSON manifest (exports/batch_export.py).
+    """
+    from exports.batch_export import main as batch_main
+
+    return batch_main(argv)
+
+
+# Command name -> (function, one-line summary for the usage text)
+COMMANDS = {
+    "list": (cmd_list, "List the database profiles, or the server's databases and tables"),
+    "sync-hierarchy": (cmd_sync_hierarchy, "Create the EBA schema and sync hierarchy/metrics"),
+    "upload": (cmd_upload, "Upload the EBA values workbook"),
+    "ingest": (cmd_ingest, "Ingest several workbooks in parallel"),
+    "export": (cmd_export, "Export demo_series or any table to xlsx/parquet/feather/csv.gz"),
+    "export-batch": (cmd_export_batch, "Run a batch of exports in parallel, with a manifest"),
+}
+
+
+# 2. Dispatch
+def _help(command):
+    return textwrap.dedent(command.__doc__).strip()
+
+
+def print_usage():
+    print("Usage: dbserv <command> [options]   (dbserv <command> --help for details)\n")
+    for name, (_, summary) in COMMANDS.items():
+        print(f"  {name:<16} {summary}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] in ("-h", "--help", "help"):
+        print_usage()
+        return 0
+
+    command, _ = COMMANDS.get(argv[0], (None, None))
+    if command is None:
+        print(f"❌ Unknown command '{argv[0]}'.\n")
+        print_usage()
+        return 2
+    if "-h" in argv[1:] or "--help" in argv[1:]:
+        print(_help(command))
+        return 0
+
+    try:
+        return command(argv[1:])
+    except (ValueError, KeyboardInterrupt) as e:
+        print(f"❌ {e or 'Interrupted'}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,428 @@
+# Server-side aggregations over the EBA series (resampling, deltas, cross-country stats, ranks)
+#
+# Everything is computed in PostgreSQL with date_trunc and window functions, so callers get
+# back one row per period/metric instead of the raw values. Metric names follow the
+# 'EBA.<metric>.<country>' layout: the metric is the name without its last part, the
+# country is the last part. Optional materialized views precompute the common cases and
+# are refreshed after uploads (see refresh_aggregate_views).
+
+import pandas as pd
+from psycopg2 import sql
+from .connection import pooled_connection, get_db_config
+from .cache import cached_read
+from .series import resolve_metrics, _as_list
+
+# Interval of one period for each date_trunc frequency
+FREQUENCIES = {
+    "day": "1 day",
+    "week": "1 week",
+    "month": "1 month",
+    "quarter": "3 months",
+    "year": "1 year",
+}
+
+# How the values inside one period are combined
+AGGREGATES = {
+    "last": "(ARRAY_AGG(v.value ORDER BY v.date DESC))[1]",
+    "first": "(ARRAY_AGG(v.value ORDER BY v.date))[1]",
+    "avg": "AVG(v.value)",
+    "min": "MIN(v.value)",
+    "max": "MAX(v.value)",
+    "sum": "SUM(v.value)",
+    "count": "COUNT(v.value)",
+}
+
+METRIC_SQL = r"regexp_replace(m.name, '\.[^.]+$', '')"
+COUNTRY_SQL = "substring(m.name FROM '[^.]+$')"
+
+# Periods are labelled by their last day (2024-03-31 for Q1 2024), like pandas' "QE"
+_BUCKET_SQL = "(date_trunc({freq}, v.date) + {step}::INTERVAL - INTERVAL '1 day')::DATE"
+
+_DATE_FILTER = """
+      AND (%s::DATE IS NULL OR v.date >= %s::DATE)
+      AND (%s::DATE IS NULL OR v.date <= %s::DATE)
+"""
+
+# --- Materialized views (optional, created with create_aggregate_views) ---
+VIEW_FREQUENCIES = ("month", "quarter", "year")
+
+AGGREGATE_VIEWS = {
+    "values_resampled": [
+        f"""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS values_resampled AS
+        SELECT v.metric_id, f.freq,
+               (date_trunc(f.freq, v.date) + f.step - INTERVAL '1 day')::DATE AS date,
+               {", ".join(f"{expr} AS {name}" for name, expr in AGGREGATES.items())}
+        FROM values v
+        CROSS JOIN (VALUES ('month', INTERVAL '1 month'),
+                           ('quarter', INTERVAL '3 months'),
+                           ('year', INTERVAL '1 year')) AS f(freq, step)
+        GROUP BY v.metric_id, f.freq, 3;
+        """,
+        # REFRESH ... CONCURRENTLY needs a unique index
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS values_resampled_key
+        ON values_resampled (metric_id, freq, date);
+        """,
+    ],
+    "country_stats": [
+        f"""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS country_stats AS
+        SELECT {METRIC_SQL} AS metric, v.date,
+               COUNT(v.value) FILTER (WHERE {COUNTRY_SQL} <> 'EU') AS countries,
+               AVG(v.value) FILTER (WHERE {COUNTRY_SQL} <> 'EU') AS mean,
+               percentile_cont(0.5) WITHIN GROUP (ORDER BY v.value)
+                   FILTER (WHERE {COUNTRY_SQL} <> 'EU') AS median,
+               STDDEV_SAMP(v.value) FILTER (WHERE {COUNTRY_SQL} <> 'EU') AS std,
+               MIN(v.value) FILTER (WHERE {COUNTRY_SQL} <> 'EU') AS min,
+               MAX(v.value) FILTER (WHERE {COUNTRY_SQL} <> 'EU') AS max,
+               MAX(v.value) FILTER (WHERE {COUNTRY_SQL} = 'EU') AS reference
+        FROM values v
+        JOIN metrics m ON m.id = v.metric_id
+        GROUP BY 1, 2;
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS country_stats_key ON country_stats (metric, date);",
+    ],
+}
+
+
+def create_aggregate_views(cur):
+    """Creates (and fills) the materialized views that back resample() and cross_country_stats()."""
+    for statements in AGGREGATE_VIEWS.values():
+        for statement in statements:
+            cur.execute(statement)
+
+
+def existing_aggregate_views(cur):
+    """Returns {view name: is populated} for the aggregate views present in the database."""
+    cur.execute(
+        "SELECT matviewname, ispopulated FROM pg_matviews WHERE matviewname = ANY(%s);",
+        (list(AGGREGATE_VIEWS),),
+    )
+    return dict(cur.fetchall())
+
+
+def drop_aggregate_views(cur):
+    """Drops the aggregate views (e.g. before "values" is rebuilt). Returns the names dropped."""
+    views = existing_aggregate_views(cur)
+    for name in views:
+        cur.execute(sql.SQL("DROP MATERIALIZED VIEW {};").format(sql.Identifier(name)))
+    return list(views)
+
+
+def refresh_aggregate_views(cur):
+    """
+    Refreshes the aggregate views that exist (CONCURRENTLY once populated, so readers
+    are not blocked). Returns the names refreshed; a no-op when none were created.
+    """
+    views = existing_aggregate_views(cur)
+    for name, populated in views.items():
+        concurrently = sql.SQL("CONCURRENTLY ") if populated else sql.SQL("")
+        cur.execute(
+            sql.SQL("REFRESH MATERIALIZED VIEW {}{};").format(concurrently, sql.Identifier(name))
+        )
+    if views:
+        print(f"🔄 Refreshed aggregate views: {', '.join(views)}.")
+    return list(views)
+
+
+# --- Query helpers ---
+def _check(freq, how="last"):
+    if freq not in FREQUENCIES:
+        raise ValueError(f"Unknown frequency '{freq}' (use one of {', '.join(FREQUENCIES)})")
+    if how not in AGGREGATES:
+        raise ValueError(f"Unknown aggregate '{how}' (use one of {', '.join(AGGREGATES)})")
+
+
+def _bucket(freq):
+    return sql.SQL(_BUCKET_SQL).format(
+        freq=sql.Literal(freq), step=sql.Literal(FREQUENCIES[freq])
+    )
+
+
+def _aggregate(name, filters, target_db, run):
+    """
+    Resolves the metrics selected by 'filters' (metrics, path, countries), then calls
+    run(cur, metric_ids) -> DataFrame. Results go through the query cache when it is on.
+    """
+    metrics, path, countries = filters
+    key = (
+        name,
+        get_db_config(target_db).dbname,
+        tuple(_as_list(metrics) or ()),
+        path,
+        tuple(_as_list(countries) or ()),
+    )
+
+    def load():
+        tags = ["table:values", "table:metrics", "table:hierarchy"]
+        with pooled_connection(target_db=target_db) as (conn, cur):
+            found = resolve_metrics(cur, metrics, path, countries)
+            if not found:
+                return pd.DataFrame(), tags
+            ids = [metric_id for metric_id, _ in found]
+            df = run(cur, ids)
+        return df, tags + [f"metric:{metric_id}" for metric_id in ids]
+
+    return load, key
+
+
+def _frame(cur):
+    return pd.DataFrame(cur.fetchall(), columns=[desc[0] for desc in cur.description])
+
+
+def _wide(df, column):
+    """Pivots a long (date, name, column) frame into one column per metric name."""
+    if df.empty:
+        return pd.DataFrame(index=pd.DatetimeIndex([], name="date"))
+    df["date"] = pd.to_datetime(df["date"])
+    wide = df.pivot(index="date", columns="name", values=column).astype("float64")
+    wide.columns.name = None
+    return wide
+
+
+# --- Public API ---
+def resample(
+    metrics=None,
+    path=None,
+    countries=None,
+    freq="quarter",
+    how="last",
+    start=None,
+    end=None,
+    use_views=False,
+    target_db=None,
+):
+    """
+    Resamples the selected series to 'freq' (day, week, month, quarter, year) combining the
+    values of each period with 'how' (last, first, avg, min, max, sum, count).
+    Returns a wide DataFrame like get_series(), indexed by the last day of each period.
+
+        resample(path="EBA_Metrics/NPE_ratio/*", freq="year", how="avg")
+
+    use_views=True reads month/quarter/year results from the values_resampled view.
+    """
+    _check(freq, how)
+    from_view = use_views and freq in VIEW_FREQUENCIES
+
+    def run(cur, ids):
+        if from_view:
+            query = sql.SQL(
+                """
+                SELECT r.date, m.name, r.{how} AS value
+                FROM values_resampled r
+                JOIN metrics m ON m.id = r.metric_id
+                WHERE r.freq = %s AND r.metric_id = ANY(%s)
+                  AND (%s::DATE IS NULL OR r.date >= %s::DATE)
+                  AND (%s::DATE IS NULL OR r.date <= %s::DATE);
+            """
+            ).format(how=sql.Identifier(how))
+            cur.execute(query, (freq, ids, start, start, end, end))
+        else:
+            query = sql.SQL(
+                """
+                SELECT {bucket} AS date, m.name, {agg} AS value
+                FROM values v
+                JOIN metrics m ON m.id = v.metric_id
+                WHERE v.metric_id = ANY(%s)
+                """
+                + _DATE_FILTER
+                + """
+                GROUP BY 1, 2;
+            """
+            ).format(bucket=_bucket(freq), agg=sql.SQL(AGGREGATES[how]))
+            cur.execute(query, (ids, start, start, end, end))
+        return _wide(_frame(cur), "value")
+
+    load, key = _aggregate("resample", (metrics, path, countries), target_db, run)
+    return cached_read(key + (freq, how, str(start), str(end), from_view), load)
+
+
+def period_deltas(
+    metrics=None,
+    path=None,
+    countries=None,
+    freq="month",
+    periods=1,
+    kind="diff",
+    start=None,
+    end=None,
+    target_db=None,
+):
+    """
+    Period-over-period change of the last value of each period: kind="diff" for
+    value - previous, kind="pct" for value / previous - 1. The previous period is matched
+    by date, so gaps in a series give NaN instead of comparing the wrong periods.
+
+        period_deltas(path="EBA_Metrics/*", countries="ES", freq="month", periods=12)  # YoY
+    """
+    _check(freq)
+    if kind not in ("diff", "pct"):
+        raise ValueError("kind must be 'diff' or 'pct'")
+
+    def run(cur, ids):
+        query = sql.SQL(
+            """
+            WITH resampled AS (
+                SELECT v.metric_id, date_trunc({freq}, v.date)::DATE AS bucket,
+                       {last} AS value
+                FROM values v
+                WHERE v.metric_id = ANY(%s)
+                  -- Reach back far enough to have a previous value for the first period
+                  AND (%s::DATE IS NULL
+                       OR v.date >= date_trunc({freq}, %s::DATE) - {step}::INTERVAL * %s)
+                  AND (%s::DATE IS NULL OR v.date <= %s::DATE)
+                GROUP BY 1, 2
+            )
+            SELECT (r.bucket + {step}::INTERVAL - INTERVAL '1 day')::DATE AS date, m.name,
+                   r.value - p.value AS diff,
+                   r.value / NULLIF(p.value, 0) - 1 AS pct
+            FROM resampled r
+            JOIN metrics m ON m.id = r.metric_id
+            LEFT JOIN resampled p
+              ON p.metric_id = r.metric_id
+             AND p.bucket = (r.bucket - {step}::INTERVAL * %s)::DATE
+            WHERE %s::DATE IS NULL OR r.bucket >= date_trunc({freq}, %s::DATE);
+        """
+        ).format(
+            freq=sql.Literal(freq),
+            step=sql.Literal(FREQUENCIES[freq]),
+            last=sql.SQL(AGGREGATES["last"]),
+        )
+        cur.execute(query, (ids, start, start, periods, end, end, periods, start, start))
+        return _wide(_frame(cur), kind)
+
+    load, key = _aggregate("period_deltas", (metrics, path, countries), target_db, run)
+    return cached_read(key + (freq, periods, kind, str(start), str(end)), load)
+
+
+def cross_country_stats(
+    metrics=None,
+    path=None,
+    countries=None,
+    freq=None,
+    reference="EU",
+    start=None,
+    end=None,
+    use_views=False,
+    target_db=None,
+):
+    """
+    Statistics across countries for each metric and date: number of countries, mean, median,
+    std, min and max of the national values, the 'reference' value (EU by default) and its
+    spread to the national mean. With freq, each country is first resampled (last value).
+    Returns a long DataFrame with one row per (metric, date).
+
+    use_views=True reads from the country_stats view when freq is None, reference is EU and
+    no metrics, path or countries narrow the selection (the view aggregates every country of
+    every metric code); otherwise the live query runs.
+    """
+    if freq:
+        _check(freq)
+    selected = metrics is not None or path is not None or countries is not None
+    from_view = use_views and freq is None and reference == "EU" and not selected
+
+    def run(cur, ids):
+        if from_view:
+            cur.execute(
+                f"""
+                SELECT s.*, s.reference - s.mean AS spread
+                FROM country_stats s
+                WHERE s.metric IN (
+                    SELECT DISTINCT {METRIC_SQL} FROM metrics m WHERE m.id = ANY(%s)
+                )
+                  AND (%s::DATE IS NULL OR s.date >= %s::DATE)
+                  AND (%s::DATE IS NULL OR s.date <= %s::DATE)
+                ORDER BY s.metric, s.date;
+            """,
+                (ids, start, start, end, end),
+            )
+            return _frame(cur)
+
+        date_expr = _bucket(freq) if freq else sql.SQL("v.date")
+        value_expr = sql.SQL(AGGREGATES["last"] if freq else "MAX(v.value)")
+        query = sql.SQL(
+            """
+            WITH country_values AS (
+                SELECT {metric} AS metric, {country} AS country, {date} AS date,
+                       {value} AS value
+                FROM values v
+                JOIN metrics m ON m.id = v.metric_id
+                WHERE v.metric_id = ANY(%s)
+            """
+            + _DATE_FILTER
+            + """
+                GROUP BY 1, 2, 3
+            )
+            SELECT metric, date,
+                   COUNT(value) FILTER (WHERE national) AS countries,
+                   AVG(value) FILTER (WHERE national) AS mean,
+                   percentile_cont(0.5) WITHIN GROUP (ORDER BY value)
+                       FILTER (WHERE national) AS median,
+                   STDDEV_SAMP(value) FILTER (WHERE national) AS std,
+                   MIN(value) FILTER (WHERE national) AS min,
+                   MAX(value) FILTER (WHERE national) AS max,
+                   MAX(value) FILTER (WHERE NOT national) AS reference,
+                   MAX(value) FILTER (WHERE NOT national)
+                       - AVG(value) FILTER (WHERE national) AS spread
+            FROM (
+                SELECT *, country IS DISTINCT FROM %s AS national FROM country_values
+            ) c
+            GROUP BY metric, date
+            ORDER BY metric, date;
+        """
+        ).format(
+            metric=sql.SQL(METRIC_SQL),
+            country=sql.SQL(COUNTRY_SQL),
+            date=date_expr,
+            value=value_expr,
+        )
+        cur.execute(query, (ids, start, start, end, end, reference))
+        return _frame(cur)
+
+    load, key = _aggregate("cross_country_stats", (metrics, path, countries), target_db, run)
+    df = cached_read(key + (freq, reference, str(start), str(end), from_view), load)
+    if not df.empty:
+        df["date"] = pd.to_datetime(df["date"])
+    return df
+
+
+def rank_countries(
+    metrics=None, path=None, countries=None, date=None, ascending=False, target_db=None
+):
+    """
+    Ranks the countries of each metric by value on 'date' (default: the metric's latest
+    date with data). Returns a long DataFrame (metric, date, country, value, rank).
+    """
+
+    def run(cur, ids):
+        query = sql.SQL(
+            """
+            WITH country_values AS (
+                SELECT {metric} AS metric, {country} AS country, v.date, v.value,
+                       MAX(v.date) OVER (PARTITION BY {metric}) AS latest
+                FROM values v
+                JOIN metrics m ON m.id = v.metric_id
+                WHERE v.metric_id = ANY(%s)
+                  AND v.value IS NOT NULL
+                  AND (%s::DATE IS NULL OR v.date = %s::DATE)
+            )
+            SELECT metric, date, country, value,
+                   RANK() OVER (PARTITION BY metric ORDER BY value {direction}) AS rank
+            FROM country_values
+            WHERE date = latest
+            ORDER BY metric, rank, country;
+        """
+        ).format(
+            metric=sql.SQL(METRIC_SQL),
+            country=sql.SQL(COUNTRY_SQL),
+            direction=sql.SQL("ASC" if ascending else "DESC"),
+        )
+        cur.execute(query, (ids, date, date))
+        return _frame(cur)
+
+    load, key = _aggregate("rank_countries", (metrics, path, countries), target_db, run)
+    df = cached_read(key + (str(date), ascending), load)
+    if not df.empty:
+        df["date"] = pd.to_datetime(df["date"])
+    return df
@@ -0,0 +1,145 @@
+# Asyncio counterparts of the connection, CRUD and series helpers.
+#
+# psycopg2 is blocking, so every database call runs in a worker thread (asyncio.to_thread)
+# on top of the same per-database ConnectionPool and cached config as the sync helpers.
+# Calls against different databases run concurrently; each pool keeps its max_size.
+
+import asyncio
+import weakref
+import functools
+import psycopg2
+from contextlib import asynccontextmanager
+
+from .connection import get_pool, get_db_config, get_db_connection
+from . import operations, series, series_store, aggregations, change_tracking
+
+
+class AsyncCursor:
+    """Awaitable wrapper around a psycopg2 cursor."""
+
+    def __init__(self, cur):
+        self.cursor = cur
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    async def execute(self, query, params=None):
+        await asyncio.to_thread(self.cursor.execute, query, params)
+
+    async def fetchone(self):
+        return await asyncio.to_thread(self.cursor.fetchone)
+
+    async def fetchmany(self, size=None):
+        size = self.cursor.arraysize if size is None else size
+        return await asyncio.to_thread(self.cursor.fetchmany, size)
+
+    async def fetchall(self):
+        return await asyncio.to_thread(self.cursor.fetchall)
+
+
+class AsyncConnection:
+    """Awaitable wrapper around a psycopg2 connection."""
+
+    def __init__(self, conn):
+        self.connection = conn
+
+    async def commit(self):
+        await asyncio.to_thread(self.connection.commit)
+
+    async def rollback(self):
+        await asyncio.to_thread(self.connection.rollback)
+
+
+class AsyncConnectionPool:
+    """
+    Async front-end over a ConnectionPool: checkouts and returns run in worker threads
+    and a semaphore caps concurrent borrowers at the pool's max_size, so waiting tasks
+    don't each hold a thread.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._semaphore = asyncio.Semaphore(pool.max_size)
+
+    @asynccontextmanager
+    async def connection(self, timeout=None):
+        async with self._semaphore:
+            conn = await asyncio.to_thread(self.pool.getconn, timeout)
+            cur = conn.cursor()
+            broken = False
+            try:
+                yield AsyncConnection(conn), AsyncCursor(cur)
+            except psycopg2.OperationalError:
+                broken = True
+                raise
+            finally:
+                if not cur.closed:
+                    cur.close()
+                await asyncio.to_thread(self.pool.putconn, conn, broken)
+
+
+# One async pool per (event loop, database config): semaphores belong to a loop. Keyed on
+# the loop object itself so a closed loop's pools go away with it and a new loop that
+# reuses its id() never inherits them.
+_ASYNC_POOLS = weakref.WeakKeyDictionary()
+
+
+def get_async_pool(target_db=None):
+    pools = _ASYNC_POOLS.setdefault(asyncio.get_running_loop(), {})
+    config = get_db_config(target_db)
+    pool = pools.get(config)
+    if pool is None:
+        pool = pools[config] = AsyncConnectionPool(get_pool(target_db))
+    return pool
+
+
+@asynccontextmanager
+async def async_pooled_connection(target_db=None, timeout=None):
+    """
+    Async version of pooled_connection():
+
+        async with async_pooled_connection("EBA") as (conn, cur):
+            await cur.execute("SELECT COUNT(*) FROM values;")
+            rows = await cur.fetchall()
+    """
+    async with get_async_pool(target_db).connection(timeout) as pair:
+        yield pair
+
+
+async def get_db_connection_async(target_db=None):
+    """Async version of get_db_connection() (a dedicated, unpooled connection)."""
+    return await asyncio.to_thread(get_db_connection, target_db)
+
+
+def _to_async(fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    return wrapper
+
+
+# CRUD and query helpers with the same names and arguments as the sync versions
+initialize_table = _to_async(operations.initialize_table)
+get_all_series = _to_async(operations.get_all_series)
+insert_series = _to_async(operations.insert_series)
+update_table = _to_async(operations.update_table)
+delete_series = _to_async(operations.delete_series)
+bulk_update = _to_async(operations.bulk_update)
+insert_series_batch = _to_async(operations.insert_series_batch)
+update_table_batch = _to_async(operations.update_table_batch)
+bulk_update_batch = _to_async(operations.bulk_update_batch)
+delete_series_batch = _to_async(operations.delete_series_batch)
+get_series = _to_async(series.get_series)
+get_series_store = _to_async(series_store.get_series_store)
+resample = _to_async(aggregations.resample)
+period_deltas = _to_async(aggregations.period_deltas)
+cross_country_stats = _to_async(aggregations.cross_country_stats)
+rank_countries = _to_async(aggregations.rank_countries)
+changes_since = _to_async(change_tracking.changes_since)
+save_watermark = _to_async(change_tracking.save_watermark)
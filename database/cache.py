@@ -0,0 +1,192 @@
+# Optional read-through cache for query results (in-process LRU + optional on-disk tier)
+
+import os
+import json
+import time
+import pickle
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+
+
+class QueryCache:
+    """
+    LRU cache bounded by total bytes, with a TTL per entry. Entries carry tags such as
+    'table:values' or 'metric:12' so writes can invalidate exactly what they touched.
+    With disk_dir set, entries are also written there and survive between processes.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=300, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self._entries = OrderedDict()  # key -> (value, size, expires_at, tags)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def _digest(key):
+        return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _copy(value):
+        # Callers may modify returned DataFrames/lists; hand out copies
+        return value.copy() if hasattr(value, "copy") else value
+
+    # --- memory tier ---
+    def _remove(self, key):
+        value, size, _, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _store(self, key, value, size, expires_at, tags):
+        if key in self._entries:
+            self._remove(key)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, size, expires_at, tags)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.counters["evictions"] += 1
+
+    # --- disk tier ---
+    def _disk_paths(self, key):
+        digest = self._digest(key)
+        return self.disk_dir / f"{digest}.pkl", self.disk_dir / f"{digest}.json"
+
+    def _disk_get(self, key):
+        data_path, meta_path = self._disk_paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["expires_at"] < time.time():
+                return None
+            with open(data_path, "rb") as f:
+                return pickle.load(f), meta
+        except (FileNotFoundError, json.JSONDecodeError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _disk_set(self, key, payload, expires_at, tags):
+        self.disk_dir.mkdir(parents=True, exist_ok=True)
+        data_path, meta_path = self._disk_paths(key)
+        tmp_path = data_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_bytes(payload)
+        os.replace(tmp_path, data_path)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({"expires_at": expires_at, "tags": sorted(tags)}, f)
+
+    # --- public API ---
+    def get_or_load(self, key, loader):
+        """
+        Returns the cached value for 'key', or calls loader() -> (value, tags),
+        caches the value under those tags and returns it.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[2] >= now:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return self._copy(entry[0])
+            if entry:
+                self._remove(key)
+
+        if self.disk_dir:
+            found = self._disk_get(key)
+            if found:
+                value, meta = found
+                with self._lock:
+                    self.counters["disk_hits"] += 1
+                    size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+                    self._store(key, value, size, meta["expires_at"], set(meta["tags"]))
+                return self._copy(value)
+
+        value, tags = loader()
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self.counters["misses"] += 1
+            self._store(key, value, len(payload), expires_at, set(tags))
+        if self.disk_dir:
+            self._disk_set(key, payload, expires_at, tags)
+        return self._copy(value)
+
+    def invalidate(self, tables=(), metric_ids=()):
+        """Drops every entry tagged with one of the given tables or metric ids."""
+        targets = {f"table:{t}" for t in tables} | {f"metric:{m}" for m in metric_ids}
+        if not targets:
+            return 0
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry[3] & targets]
+            for key in stale:
+                self._remove(key)
+        removed = len(stale)
+
+        if self.disk_dir and self.disk_dir.exists():
+            for meta_path in self.disk_dir.glob("*.json"):
+                try:
+                    with open(meta_path, "r", encoding="utf-8") as f:
+                        tags = set(json.load(f)["tags"])
+                except (FileNotFoundError, json.JSONDecodeError):
+                    continue
+                if tags & targets:
+                    meta_path.unlink(missing_ok=True)
+                    meta_path.with_suffix(".pkl").unlink(missing_ok=True)
+                    removed += 1
+
+        with self._lock:
+            self.counters["invalidations"] += removed
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.disk_dir and self.disk_dir.exists():
+            for path in self.disk_dir.glob("*.*"):
+                path.unlink(missing_ok=True)
+
+    def stats(self):
+        """Hit/miss counters plus the current size of the memory tier."""
+        with self._lock:
+            return {**self.counters, "entries": len(self._entries), "bytes": self._bytes}
+
+
+# Process-wide cache, disabled until enable_query_cache() is called.
+# Setting DB_QUERY_CACHE_DIR enables it with that disk tier in every process, so writers
+# (e.g. upload_series_EBA) invalidate what readers (dashboards) have cached on disk.
+_QUERY_CACHE = None
+
+
+def enable_query_cache(max_bytes=64 * 1024 * 1024, ttl=300, disk_dir=None):
+    global _QUERY_CACHE
+    _QUERY_CACHE = QueryCache(max_bytes=max_bytes, ttl=ttl, disk_dir=disk_dir)
+    return _QUERY_CACHE
+
+
+def disable_query_cache():
+    global _QUERY_CACHE
+    _QUERY_CACHE = None
+
+
+def get_query_cache():
+    return _QUERY_CACHE
+
+
+def cached_read(key, loader):
+    """Runs loader() through the cache when it is enabled (loader returns (value, tags))."""
+    if _QUERY_CACHE is None:
+        return loader()[0]
+    return _QUERY_CACHE.get_or_load(key, loader)
+
+
+def invalidate(tables=(), metric_ids=()):
+    """Called after writes; a no-op while the cache is disabled."""
+    if _QUERY_CACHE is not None:
+        _QUERY_CACHE.invalidate(tables=tables, metric_ids=metric_ids)
+
+
+if os.getenv("DB_QUERY_CACHE_DIR"):
+    enable_query_cache(disk_dir=os.getenv("DB_QUERY_CACHE_DIR"))
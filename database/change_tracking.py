@@ -0,0 +1,242 @@
+# Change tracking for the managed tables and watermark-based incremental reads
+#
+# Every tracked table gets two columns maintained by PostgreSQL itself:
+#   updated_at   TIMESTAMPTZ  when the row was last inserted/updated
+#   change_xid   xid8         the (64-bit, ever increasing) id of the transaction that did it
+# Inserts fill them through column defaults, a BEFORE UPDATE trigger refreshes them and an
+# AFTER DELETE trigger records the key of removed rows in 'deleted_rows'.
+#
+# A watermark is a transaction id. changes_since() reads, in one REPEATABLE READ snapshot,
+# the rows written by transactions in [watermark, xmin of the snapshot): every transaction
+# below that xmin has finished, so a change is never skipped because a slower transaction
+# committed after the read. The next watermark is that xmin; consumers store it in
+# 'change_watermarks' (save_watermark) once their export is safely written.
+
+from dataclasses import dataclass, field
+from typing import Optional
+
+from psycopg2 import sql
+from .connection import pooled_connection
+
+TRACKING_COLUMNS = ("updated_at", "change_xid")
+
+CHANGE_TRACKING_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS deleted_rows (
+        table_name TEXT NOT NULL,
+        row_key JSONB NOT NULL,
+        deleted_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        change_xid XID8 NOT NULL DEFAULT pg_current_xact_id()
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS deleted_rows_table_xid_idx ON deleted_rows (table_name, change_xid);",
+    """
+    CREATE TABLE IF NOT EXISTS change_watermarks (
+        consumer TEXT NOT NULL,
+        table_name TEXT NOT NULL,
+        watermark BIGINT NOT NULL,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (consumer, table_name)
+    );
+    """,
+    """
+    CREATE OR REPLACE FUNCTION track_row_change() RETURNS TRIGGER AS $$
+    BEGIN
+        NEW.updated_at := now();
+        NEW.change_xid := pg_current_xact_id();
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+    # TG_ARGV: the logical table name (partitions report their own) and the key columns
+    """
+    CREATE OR REPLACE FUNCTION track_row_delete() RETURNS TRIGGER AS $$
+    DECLARE
+        old_row JSONB := to_jsonb(OLD);
+    BEGIN
+        INSERT INTO deleted_rows (table_name, row_key)
+        SELECT TG_ARGV[0], jsonb_object_agg(key, old_row -> key)
+        FROM unnest(TG_ARGV[1:]) AS key;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+]
+
+
+def change_tracking_statements(table, key_columns):
+    """
+    The idempotent statements that enable tracking on 'table' (usable in a migration).
+    Existing rows keep NULL in the new columns (no table rewrite); they count as changed
+    for a consumer without a watermark only.
+    """
+    table_id = sql.Identifier(table)
+    arguments = sql.SQL(", ").join(sql.Literal(arg) for arg in [table, *key_columns])
+    statements = [
+        sql.SQL(
+            "ALTER TABLE {} ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ, "
+            "ADD COLUMN IF NOT EXISTS change_xid XID8;"
+        ).format(table_id),
+        sql.SQL(
+            "ALTER TABLE {} ALTER COLUMN updated_at SET DEFAULT now(), "
+            "ALTER COLUMN change_xid SET DEFAULT pg_current_xact_id();"
+        ).format(table_id),
+        sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} (change_xid);").format(
+            sql.Identifier(f"{table}_change_xid_idx"), table_id
+        ),
+        sql.SQL(
+            "CREATE OR REPLACE TRIGGER {} BEFORE UPDATE ON {} "
+            "FOR EACH ROW EXECUTE FUNCTION track_row_change();"
+        ).format(sql.Identifier(f"{table}_track_change"), table_id),
+        sql.SQL(
+            "CREATE OR REPLACE TRIGGER {} AFTER DELETE ON {} "
+            "FOR EACH ROW EXECUTE FUNCTION track_row_delete({});"
+        ).format(sql.Identifier(f"{table}_track_delete"), table_id, arguments),
+    ]
+    return CHANGE_TRACKING_DDL + statements
+
+
+def enable_change_tracking(cur, table, key_columns):
+    """Adds the tracking columns, index and triggers to 'table' (safe to call on every setup)."""
+    for statement in change_tracking_statements(table, key_columns):
+        cur.execute(statement)
+
+
+def has_change_tracking(cur, table):
+    cur.execute(
+        """
+        SELECT COUNT(*) = 2 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND column_name = ANY(%s);
+    """,
+        (table, list(TRACKING_COLUMNS)),
+    )
+    return cur.fetchone()[0]
+
+
+# --- Watermarks -----------------------------------------------------------------------
+def load_watermark(cur, consumer, table):
+    """The stored watermark of 'consumer' for 'table', or None if it never read it."""
+    cur.execute(
+        "SELECT watermark FROM change_watermarks WHERE consumer = %s AND table_name = %s;",
+        (consumer, table),
+    )
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def save_watermark(consumer, table, watermark, target_db=None):
+    """Records the watermark a consumer has reached (call it after the export is written)."""
+    with pooled_connection(target_db=target_db) as (conn, cur):
+        cur.execute(
+            """
+            INSERT INTO change_watermarks (consumer, table_name, watermark)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (consumer, table_name)
+            DO UPDATE SET watermark = EXCLUDED.watermark, updated_at = now();
+        """,
+            (consumer, table, watermark),
+        )
+        conn.commit()
+
+
+# --- Incremental reads ----------------------------------------------------------------
+@dataclass
+class Changes:
+    """Rows of 'table' changed in [since, watermark) plus the keys of deleted rows."""
+
+    table: str
+    since: Optional[int]
+    watermark: int
+    columns: list
+    rows: list
+    description: tuple = None  # cursor.description of the rows (column types)
+    deleted: list = field(default_factory=list)  # key dicts, e.g. {"metric_id": 3, "date": "2024-03-01"}
+
+    def __len__(self):
+        return len(self.rows) + len(self.deleted)
+
+    def to_frame(self):
+        """One DataFrame: changed rows with change='upsert', deleted keys with change='delete'."""
+        import pandas as pd
+        from exports.writers import frame_from_cursor
+
+        frame = frame_from_cursor(self.rows, self.description or self.columns)
+        frame["change"] = "upsert"
+        if self.deleted:
+            deleted = pd.DataFrame(self.deleted).assign(change="delete")
+            # The keys come back from JSONB (dates as text): give them the columns' dtypes,
+            # otherwise the concat mixes types and Parquet/Feather writers reject the column
+            for column in deleted.columns.intersection(frame.columns.drop("change")):
+                dtype = frame[column].dtype
+                if pd.api.types.is_datetime64_any_dtype(dtype):
+                    utc = getattr(dtype, "tz", None) is not None
+                    deleted[column] = pd.to_datetime(deleted[column], utc=utc)
+                else:
+                    deleted[column] = deleted[column].astype(dtype)
+            frame = pd.concat([frame, deleted], ignore_index=True)
+        return frame
+
+
+def read_changes(cur, table, since=None, columns=None):
+    """
+    Reads the changes of 'table' since the watermark 'since' (None: every row).
+    Must run inside a REPEATABLE READ transaction so the bounds and rows share one snapshot.
+    """
+    cur.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::TEXT::BIGINT;")
+    watermark = cur.fetchone()[0]
+
+    select = sql.SQL(", ").join(sql.Identifier(c) for c in columns) if columns else sql.SQL("*")
+    if since is None:
+        # First read: everything up to the snapshot, including rows from before tracking
+        condition = sql.SQL("change_xid IS NULL OR change_xid < %s::TEXT::XID8")
+        params = [watermark]
+    else:
+        condition = sql.SQL("change_xid >= %s::TEXT::XID8 AND change_xid < %s::TEXT::XID8")
+        params = [since, watermark]
+    cur.execute(
+        sql.SQL("SELECT {} FROM {} WHERE {};").format(select, sql.Identifier(table), condition),
+        params,
+    )
+    description = cur.description
+    rows = cur.fetchall()
+
+    deleted = []
+    if since is not None:
+        cur.execute(
+            """
+            SELECT row_key FROM deleted_rows
+            WHERE table_name = %s AND change_xid >= %s::TEXT::XID8 AND change_xid < %s::TEXT::XID8
+            ORDER BY change_xid;
+        """,
+            (table, since, watermark),
+        )
+        deleted = [row[0] for row in cur.fetchall()]
+
+    return Changes(
+        table=table,
+        since=since,
+        watermark=watermark,
+        columns=[desc[0] for desc in description],
+        rows=rows,
+        description=description,
+        deleted=deleted,
+    )
+
+
+def changes_since(table, since=None, consumer=None, columns=None, target_db=None):
+    """
+    Returns the Changes of 'table' since the watermark 'since' or, when only 'consumer' is
+    given, since that consumer's stored watermark. Nothing is recorded: call
+    save_watermark(consumer, table, changes.watermark) once the changes are handled.
+
+        changes = changes_since("values", consumer="warehouse", target_db="EBA")
+        write(changes.to_frame())
+        save_watermark("warehouse", "values", changes.watermark, target_db="EBA")
+    """
+    with pooled_connection(target_db=target_db) as (conn, cur):
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+        if since is None and consumer:
+            since = load_watermark(cur, consumer, table)
+        changes = read_changes(cur, table, since, columns)
+        conn.rollback()
+    return changes
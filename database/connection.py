@@ -1,15 +1,36 @@
 # Database connection configuration file & data logic
 
 import os
+import time
+import atexit
+import threading
 import yaml
 import psycopg2
 from pathlib import Path
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Optional
 from dotenv import load_dotenv
 
+from .instrumentation import InstrumentedConnection
+
 # 1. Get Absolute Paths
 BASE_DIR = Path(__file__).resolve().parent.parent
-ENV_PATH = BASE_DIR / ".env"
-CONFIG_PATH = BASE_DIR / "config" / "database.yaml"
+
+
+def project_file(*parts):
+    """
+    Locates a project file (config/database.yaml, .env, ...) in the working directory first,
+    then in the source tree: an installed 'dbserv' runs from site-packages, where the
+    config/ folder and .env are not shipped.
+    """
+    local = Path.cwd().joinpath(*parts)
+    return local if local.exists() else BASE_DIR.joinpath(*parts)
+
+
+ENV_PATH = project_file(".env")
+# DB_CONFIG_PATH points the package at another YAML (e.g. the benchmark's throwaway server)
+CONFIG_PATH = Path(os.getenv("DB_CONFIG_PATH") or project_file("config", "database.yaml"))
 
 # 2. Load .env if it exists
 if ENV_PATH.exists():
@@ -19,13 +40,50 @@ else:
 
 
 # 3. Load DB config with optional target_db override
-def load_db_config(target_db=None):
-    """
-    Loads configuration. If target_db is provided, it overrides
-    the 'database' field from the YAML file.
-    """
+@dataclass(frozen=True)
+class DBConfig:
+    """Validated, immutable connection settings for one target database."""
+
+    dbname: str
+    user: str
+    password: Optional[str] = field(repr=False)
+    host: str
+    port: int
+
+    def as_params(self):
+        """Keyword arguments for psycopg2.connect (a fresh dict the caller may modify)."""
+        return {
+            "dbname": self.dbname,
+            "user": self.user,
+            "password": self.password,
+            "host": self.host,
+            "port": self.port,
+        }
+
+
+# Parsed YAML + resolved configs, invalidated when the file's mtime changes
+_CONFIG_CACHE = {"mtime": None, "raw": None, "password": None, "resolved": {}}
+_CONFIG_LOCK = threading.Lock()
+
+
+def _validate_config(raw):
+    missing = [key for key in ("username", "host", "database") if not raw.get(key)]
+    if missing:
+        raise ValueError(f"Missing keys in {CONFIG_PATH}: {', '.join(missing)}")
+    for name, profile in (raw.get("profiles") or {}).items():
+        if not isinstance(profile, dict):
+            raise ValueError(f"Profile '{name}' in {CONFIG_PATH} must be a mapping")
+
+
+def _load_raw_config():
+    """Returns the parsed YAML, re-reading it only when the file has changed."""
+    mtime = CONFIG_PATH.stat().st_mtime_ns
+    if _CONFIG_CACHE["mtime"] == mtime:
+        return _CONFIG_CACHE["raw"]
+
     with open(CONFIG_PATH, "r") as f:
-        config = yaml.safe_load(f)
+        raw = yaml.safe_load(f)
+    _validate_config(raw)
 
     db_pass = os.getenv("DB_PASSWORD")
     if db_pass:
@@ -33,16 +91,49 @@ def load_db_config(target_db=None):
     else:
         print(f"❌ ERROR: DB_PASSWORD is empty in {ENV_PATH}")
 
-    # Use target_db if provided, else use YAML default
-    selected_db = target_db if target_db else config["database"]
+    _CONFIG_CACHE.update(mtime=mtime, raw=raw, password=db_pass, resolved={})
+    return raw
+
+
+def get_db_config(target_db=None):
+    """
+    Returns the cached DBConfig for target_db. target_db may be the name of a
+    profile in the YAML 'profiles' section (e.g. demo, EBA) or a plain database name.
+    """
+    with _CONFIG_LOCK:
+        raw = _load_raw_config()
+        cached = _CONFIG_CACHE["resolved"].get(target_db)
+        if cached:
+            return cached
+
+        # Profile settings override the top-level defaults
+        profile = (raw.get("profiles") or {}).get(target_db) or {}
+        settings = {**raw, **profile}
+        if target_db and not profile:
+            settings["database"] = target_db
+
+        # password_env (top level or per profile) names another variable than DB_PASSWORD
+        password = _CONFIG_CACHE["password"]
+        if settings.get("password_env"):
+            password = (os.getenv(settings["password_env"]) or "").strip() or password
+
+        config = DBConfig(
+            dbname=settings["database"],
+            user=settings["username"],
+            password=password,
+            host=settings["host"],
+            port=int(settings.get("port", 5432)),
+        )
+        _CONFIG_CACHE["resolved"][target_db] = config
+        return config
+
 
-    return {
-        "dbname": selected_db,
-        "user": config["username"],
-        "password": db_pass,
-        "host": config["host"],
-        "port": config.get("port", 5432),
-    }
+def load_db_config(target_db=None):
+    """
+    Loads configuration. If target_db is provided, it overrides
+    the 'database' field from the YAML file (or selects a named profile).
+    """
+    return get_db_config(target_db).as_params()
 
 
 # 4. Explicit connection helper with optional override
@@ -54,6 +145,185 @@ def get_db_connection(target_db=None):
     params = load_db_config(target_db)
     print(f"🔌 Connecting to database: {params['dbname']}")
 
-    conn = psycopg2.connect(**params)
+    conn = psycopg2.connect(connection_factory=InstrumentedConnection, **params)
     cur = conn.cursor()
     return conn, cur
+
+
+# 5. Connection pool (one per target database)
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections for a single database.
+    Idle connections are health-checked on checkout and evicted after max_idle seconds.
+    Connections are opened lazily, on demand: min_size is not a warm-up size but the floor
+    below which idle eviction stops closing connections.
+    """
+
+    def __init__(self, params, min_size=1, max_size=10, max_idle=300, check_after=30):
+        self.params = params
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.check_after = check_after
+        self._idle = []  # (connection, last_used) pairs, most recent last
+        self._in_use = 0
+        self._cond = threading.Condition()
+
+    def _connect(self):
+        print(f"🔌 Connecting to database: {self.params['dbname']}")
+        # Statements are timed while instrumentation is enabled (params may override the factory)
+        return psycopg2.connect(**{"connection_factory": InstrumentedConnection, **self.params})
+
+    def _is_healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        # Skip the round trip for connections that were used a moment ago
+        if time.monotonic() - last_used < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _evict_idle(self):
+        """Closes connections idle for longer than max_idle (keeps min_size alive)."""
+        now = time.monotonic()
+        keep = []
+        for conn, last_used in self._idle:
+            total = len(keep) + self._in_use
+            if now - last_used > self.max_idle and total >= self.min_size:
+                conn.close()
+            else:
+                keep.append((conn, last_used))
+        self._idle = keep
+
+    def getconn(self, timeout=None):
+        """Borrows a connection, waiting up to 'timeout' seconds if the pool is full."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._evict_idle()
+            while True:
+                while self._idle:
+                    conn, last_used = self._idle.pop()
+                    if self._is_healthy(conn, last_used):
+                        self._in_use += 1
+                        return conn
+                    conn.close()
+                if self._in_use < self.max_size:
+                    self._in_use += 1
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(
+                        f"No free connection for '{self.params['dbname']}' after {timeout}s"
+                    )
+                self._cond.wait(remaining)
+
+        # Open the new connection outside the lock
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn, discard=False):
+        """Returns a connection to the pool, rolling back any open transaction."""
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        with self._cond:
+            self._in_use -= 1
+            if discard or conn.closed:
+                if not conn.closed:
+                    conn.close()
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            for conn, _ in self._idle:
+                conn.close()
+            self._idle = []
+
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def list_profiles():
+    """Names of the profiles in the YAML 'profiles' section."""
+    with _CONFIG_LOCK:
+        return list(_load_raw_config().get("profiles") or {})
+
+
+def load_pool_config():
+    """Reads the optional 'pool' section of the YAML file (sizes and idle timeout)."""
+    with _CONFIG_LOCK:
+        return _load_raw_config().get("pool") or {}
+
+
+def get_pool(target_db=None):
+    """
+    Returns the process-wide pool for target_db, creating it on first use.
+    Pools are keyed by the resolved DBConfig, so editing the YAML starts a new pool.
+    """
+    key = get_db_config(target_db)
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool_config = load_pool_config()
+            pool = ConnectionPool(
+                key.as_params(),
+                min_size=pool_config.get("min_size", 1),
+                max_size=pool_config.get("max_size", 10),
+                max_idle=pool_config.get("max_idle_seconds", 300),
+            )
+            _POOLS[key] = pool
+    return pool
+
+
+@contextmanager
+def pooled_connection(target_db=None, timeout=None):
+    """
+    Borrows a connection and cursor from the pool:
+
+        with pooled_connection() as (conn, cur):
+            cur.execute(...)
+            conn.commit()
+
+    Uncommitted work is rolled back when the block exits; the connection is discarded
+    if it broke while in use.
+    """
+    pool = get_pool(target_db)
+    conn = pool.getconn(timeout=timeout)
+    cur = None
+    broken = False
+    try:
+        cur = conn.cursor()
+        yield conn, cur
+    except psycopg2.OperationalError:
+        broken = True
+        raise
+    finally:
+        if cur and not cur.closed:
+            cur.close()
+        pool.putconn(conn, discard=broken)
+
+
+def close_all_pools():
+    with _POOLS_LOCK:
+        for pool in _POOLS.values():
+            pool.closeall()
+        _POOLS.clear()
+
+
+atexit.register(close_all_pools)
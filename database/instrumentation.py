@@ -0,0 +1,329 @@
+# Optional instrumentation: per-statement timings grouped by normalized SQL, plus stage spans
+#
+# Every connection handed out by connection.py uses InstrumentedConnection; while
+# instrumentation is disabled its cursors only pay one global check per statement.
+
+import os
+import re
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+import psycopg2.extensions
+
+
+# --- SQL normalization ---------------------------------------------------------------
+_WHITESPACE = re.compile(r"\s+")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?(?![\w])")
+_NULL = re.compile(r"(?<=[(,])\s*NULL\b", re.IGNORECASE)
+_ARRAY = re.compile(r"ARRAY\[[^\]]*\]")
+_TUPLE_LIST = re.compile(r"(\([^()]*\))(?:\s*,\s*\([^()]*\))+")
+
+
+def normalize_sql(query):
+    """
+    Turns a statement into a grouping key: literals become '?', whitespace is collapsed and
+    long VALUES/ARRAY lists (e.g. from execute_values) are folded into one element.
+    """
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    query = _WHITESPACE.sub(" ", str(query)).strip().rstrip(";")
+    query = _STRING.sub("?", query)
+    query = _NUMBER.sub("?", query)
+    query = _NULL.sub("?", query)
+    query = _ARRAY.sub("ARRAY[?]", query)
+    return _TUPLE_LIST.sub(r"\1, ...", query)
+
+
+# --- sinks ---------------------------------------------------------------------------
+class MemorySink:
+    """Keeps running totals per normalized statement and per stage (used for the run report)."""
+
+    def __init__(self):
+        self.statements = {}  # sql -> {"calls", "seconds", "max_seconds", "rows", "bytes", "errors"}
+        self.stages = {}  # name -> {"calls", "seconds"}
+        self._lock = threading.Lock()
+
+    def record(self, event):
+        with self._lock:
+            if event["kind"] == "span":
+                stage = self.stages.setdefault(event["name"], {"calls": 0, "seconds": 0.0})
+                stage["calls"] += 1
+                stage["seconds"] += event["seconds"]
+                return
+            stats = self.statements.setdefault(
+                event["sql"],
+                {"calls": 0, "seconds": 0.0, "max_seconds": 0.0, "rows": 0, "bytes": 0, "errors": 0},
+            )
+            stats["calls"] += event["calls"]
+            stats["seconds"] += event["seconds"]
+            stats["max_seconds"] = max(stats["max_seconds"], event["seconds"])
+            stats["rows"] += event["rows"]
+            stats["bytes"] += event["bytes"]
+            stats["errors"] += 1 if event["error"] else 0
+
+    def flush(self):
+        pass
+
+    def summary(self):
+        """Copies of the statement and stage totals."""
+        with self._lock:
+            return {
+                "statements": {sql: dict(s) for sql, s in self.statements.items()},
+                "stages": {name: dict(s) for name, s in self.stages.items()},
+            }
+
+
+class LogSink:
+    """Appends one JSON line per statement/span to 'path' (a structured log for later analysis)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def record(self, event):
+        line = json.dumps({"ts": round(time.time(), 3), **event}, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+
+class PrometheusSink(MemorySink):
+    """Writes the totals in Prometheus text format to 'path' on flush() (node_exporter textfile)."""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+    @staticmethod
+    def _label(value):
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    def flush(self):
+        summary = self.summary()
+        lines = []
+        for metric, key, kind in (
+            ("db_statement_calls_total", "calls", "counter"),
+            ("db_statement_seconds_total", "seconds", "counter"),
+            ("db_statement_rows_total", "rows", "counter"),
+            ("db_statement_bytes_total", "bytes", "counter"),
+            ("db_statement_errors_total", "errors", "counter"),
+        ):
+            lines.append(f"# TYPE {metric} {kind}")
+            for sql, stats in summary["statements"].items():
+                lines.append(f'{metric}{{sql="{self._label(sql)}"}} {stats[key]}')
+        lines.append("# TYPE run_stage_seconds_total counter")
+        for name, stats in summary["stages"].items():
+            lines.append(f'run_stage_seconds_total{{stage="{self._label(name)}"}} {stats["seconds"]}')
+
+        # Write-then-rename so a scraper never reads a half-written file
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.path)
+
+
+# --- recorder ------------------------------------------------------------------------
+class Instrumentation:
+    """Fans statement and span events out to its sinks; always keeps a MemorySink for the report."""
+
+    def __init__(self, sinks=None):
+        self.sinks = list(sinks or [])
+        self.memory = next((s for s in self.sinks if type(s) is MemorySink), None)
+        if self.memory is None:
+            self.memory = MemorySink()
+            self.sinks.append(self.memory)
+
+    def record_query(self, query, seconds, rows=0, nbytes=0, calls=1, error=False):
+        event = {
+            "kind": "query",
+            "sql": normalize_sql(query),
+            "seconds": seconds,
+            "rows": max(rows, 0),
+            "bytes": nbytes,
+            "calls": calls,
+            "error": error,
+        }
+        for sink in self.sinks:
+            sink.record(event)
+
+    def record_span(self, name, seconds):
+        event = {"kind": "span", "name": name, "seconds": seconds}
+        for sink in self.sinks:
+            sink.record(event)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def print_report(self, top=10):
+        """Prints the stage timings and the statements that took the most database time."""
+        summary = self.memory.summary()
+        statements = summary["statements"]
+
+        print("\n=== 📊 RUN REPORT ===")
+        for name, stats in summary["stages"].items():
+            print(f"⏱️ {name:<16} {stats['seconds']:>9.3f}s  ({stats['calls']}x)")
+
+        calls = sum(s["calls"] for s in statements.values())
+        seconds = sum(s["seconds"] for s in statements.values())
+        rows = sum(s["rows"] for s in statements.values())
+        nbytes = sum(s["bytes"] for s in statements.values())
+        print(
+            f"🗄️ {calls:,} round trips, {seconds:.3f}s in the database, "
+            f"{rows:,} rows, {nbytes / 1024:,.1f} KB sent"
+        )
+        ranked = sorted(statements.items(), key=lambda item: item[1]["seconds"], reverse=True)
+        for sql, stats in ranked[:top]:
+            text = sql if len(sql) <= 70 else sql[:67] + "..."
+            print(f"   {stats['calls']:>7,}x {stats['seconds']:>8.3f}s {stats['rows']:>9,} rows  {text}")
+        print("=" * 30 + "\n")
+
+
+# Process-wide recorder, disabled until enable_instrumentation() is called.
+# DB_METRICS_LOG (JSON lines) and DB_METRICS_FILE (Prometheus text) enable it in every process.
+_INSTRUMENTATION = None
+
+
+def enable_instrumentation(sinks=None):
+    global _INSTRUMENTATION
+    _INSTRUMENTATION = Instrumentation(sinks)
+    return _INSTRUMENTATION
+
+
+def disable_instrumentation():
+    global _INSTRUMENTATION
+    if _INSTRUMENTATION is not None:
+        _INSTRUMENTATION.flush()
+    _INSTRUMENTATION = None
+
+
+def get_instrumentation():
+    return _INSTRUMENTATION
+
+
+@contextmanager
+def span(name):
+    """Times a stage outside the database (e.g. read_excel, reshape); a no-op while disabled."""
+    if _INSTRUMENTATION is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder = _INSTRUMENTATION
+        if recorder is not None:
+            recorder.record_span(name, time.perf_counter() - start)
+
+
+# --- psycopg2 hooks ------------------------------------------------------------------
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """Cursor that reports every execute/executemany/copy_expert to the active recorder."""
+
+    def execute(self, query, vars=None):
+        recorder = _INSTRUMENTATION
+        if recorder is None:
+            return super().execute(query, vars)
+        start = time.perf_counter()
+        error = False
+        try:
+            return super().execute(query, vars)
+        except Exception:
+            error = True
+            raise
+        finally:
+            sent = self.query if self.query is not None else query
+            recorder.record_query(
+                sent, time.perf_counter() - start, self.rowcount, len(sent or b""), error=error
+            )
+
+    def executemany(self, query, vars_list):
+        recorder = _INSTRUMENTATION
+        if recorder is None:
+            return super().executemany(query, vars_list)
+        vars_list = list(vars_list)
+        start = time.perf_counter()
+        error = False
+        try:
+            return super().executemany(query, vars_list)
+        except Exception:
+            error = True
+            raise
+        finally:
+            # One round trip per parameter set; the size of the last statement stands in for all
+            sent = self.query if self.query is not None else query
+            recorder.record_query(
+                query,
+                time.perf_counter() - start,
+                self.rowcount,
+                len(sent or b"") * len(vars_list),
+                calls=len(vars_list),
+                error=error,
+            )
+
+    def copy_expert(self, sql, file, size=8192):
+        recorder = _INSTRUMENTATION
+        if recorder is None:
+            return super().copy_expert(sql, file, size)
+        try:
+            position = file.tell()
+        except (AttributeError, OSError):
+            position = None
+        start = time.perf_counter()
+        error = False
+        try:
+            return super().copy_expert(sql, file, size)
+        except Exception:
+            error = True
+            raise
+        finally:
+            # COPY payload size: how far the file was read (FROM) or written (TO)
+            nbytes = len(sql)
+            if position is not None:
+                try:
+                    nbytes += abs(file.tell() - position)
+                except (AttributeError, OSError, ValueError):
+                    pass
+            recorder.record_query(
+                sql, time.perf_counter() - start, self.rowcount, nbytes, error=error
+            )
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """Connection whose cursors are InstrumentedCursor; commits and rollbacks count as statements."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = InstrumentedCursor
+
+    def _timed(self, name, method):
+        recorder = _INSTRUMENTATION
+        if recorder is None:
+            return method()
+        start = time.perf_counter()
+        try:
+            return method()
+        finally:
+            recorder.record_query(name, time.perf_counter() - start)
+
+    def commit(self):
+        return self._timed("COMMIT", super().commit)
+
+    def rollback(self):
+        return self._timed("ROLLBACK", super().rollback)
+
+
+if os.getenv("DB_METRICS_LOG") or os.getenv("DB_METRICS_FILE"):
+    _sinks = [MemorySink()]
+    if os.getenv("DB_METRICS_LOG"):
+        _sinks.append(LogSink(os.getenv("DB_METRICS_LOG")))
+    if os.getenv("DB_METRICS_FILE"):
+        _sinks.append(PrometheusSink(os.getenv("DB_METRICS_FILE")))
+    enable_instrumentation(_sinks)
@@ -0,0 +1,38 @@
+# Versioned schema migrations, applied once per database and recorded in 'schema_migrations'
+
+
+def apply_migrations(cur, namespace, migrations):
+    """
+    Applies the pending migrations of 'namespace' inside the caller's transaction.
+    'migrations' is a list of (version, name, [sql statements]) in ascending order.
+    An advisory lock keeps two concurrent setups from applying the same version.
+    Returns the versions that were applied.
+    """
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            namespace TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (namespace, version)
+        );
+    """
+    )
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", (namespace,))
+    cur.execute("SELECT version FROM schema_migrations WHERE namespace = %s;", (namespace,))
+    applied = {row[0] for row in cur.fetchall()}
+
+    newly_applied = []
+    for version, name, statements in migrations:
+        if version in applied:
+            continue
+        for statement in statements:
+            cur.execute(statement)
+        cur.execute(
+            "INSERT INTO schema_migrations (namespace, version, name) VALUES (%s, %s, %s);",
+            (namespace, version, name),
+        )
+        newly_applied.append(version)
+        print(f"🛠️ Applied migration {namespace} #{version}: {name}")
+    return newly_applied
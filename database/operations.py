@@ -1,154 +1,231 @@
 # CRUD operations (Create, Read, Update and Delete) for database records
 
-from .connection import get_db_connection
+from psycopg2.extras import execute_values
+from .connection import pooled_connection, get_db_config
+from .cache import cached_read, invalidate
+from .change_tracking import enable_change_tracking
+
+# Rows sent per statement by the *_batch helpers
+DEFAULT_PAGE_SIZE = 1000
 
 
 def initialize_table():
     """Creates the table"""
-    conn, cur = None, None
-    try:
-        conn, cur = get_db_connection()
-        query = """
-        CREATE TABLE IF NOT EXISTS demo_series (
-            id SERIAL PRIMARY KEY,
-            title VARCHAR(100) NOT NULL UNIQUE,
-            genre VARCHAR(50),
-            seasons INTEGER,
-            rating NUMERIC(3, 1),
-            release_year INTEGER
-        );
-        """
-        cur.execute(query)
-        conn.commit()
-        print("Table 'demo_series' initialized successfully.")
-
-        # Add a new column to the table
-        cur.execute(
+    with pooled_connection() as (conn, cur):
+        try:
+            query = """
+            CREATE TABLE IF NOT EXISTS demo_series (
+                id SERIAL PRIMARY KEY,
+                title VARCHAR(100) NOT NULL UNIQUE,
+                genre VARCHAR(50),
+                seasons INTEGER,
+                rating NUMERIC(3, 1),
+                release_year INTEGER
+            );
             """
-            ALTER TABLE demo_series 
-            ADD COLUMN IF NOT EXISTS streaming_platform VARCHAR(30);
-        """
-        )
-        conn.commit()
-        print("✅ Table and columns initialized successfully.")
-    except Exception as e:
-        if conn:
+            cur.execute(query)
+            conn.commit()
+            print("Table 'demo_series' initialized successfully.")
+
+            # Add a new column to the table
+            cur.execute(
+                """
+                ALTER TABLE demo_series
+                ADD COLUMN IF NOT EXISTS streaming_platform VARCHAR(30);
+            """
+            )
+            conn.commit()
+
+            # updated_at / change_xid columns and a log of deleted ids (incremental exports)
+            enable_change_tracking(cur, "demo_series", ["id"])
+            conn.commit()
+            print("✅ Table and columns initialized successfully.")
+        except Exception as e:
             conn.rollback()
-        print(f"Error initializing table: {e}")
-        raise e
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
+            print(f"Error initializing table: {e}")
+            raise e
 
 
 def get_all_series():
-    """Returns all rows AND column names from the database."""
-    conn, cur = None, None
-    try:
-        conn, cur = get_db_connection()
-        cur.execute("SELECT * FROM demo_series ORDER BY id ASC;")
+    """Returns all rows AND column names from the database (cached when the query cache is on)."""
+
+    def load():
+        with pooled_connection() as (conn, cur):
+            cur.execute("SELECT * FROM demo_series ORDER BY id ASC;")
 
-        # 1. Capture the column names from the cursor description
-        # desc[0] is the name of the column
-        columns = [desc[0] for desc in cur.description]
+            # 1. Capture the column names from the cursor description
+            # desc[0] is the name of the column
+            columns = [desc[0] for desc in cur.description]
 
-        # 2. Capture the actual row data
-        data = cur.fetchall()
+            # 2. Capture the actual row data
+            data = cur.fetchall()
 
-        # 3. Return BOTH as a tuple
-        return data, columns
+            # 3. Return BOTH as a tuple (tagged so writes to the table invalidate it)
+            return (data, columns), ["table:demo_series"]
+
+    try:
+        return cached_read(("get_all_series", get_db_config().dbname), load)
     except Exception as e:
         print(f"Error fetching data: {e}")
         return [], []
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
 
 
 def insert_series(series_list):
     """Inserts rows"""
-    conn, cur = None, None
-    try:
-        conn, cur = get_db_connection()
-        query = """
-        INSERT INTO demo_series (title, genre, seasons, rating, release_year)
-        VALUES (%s, %s, %s, %s, %s)
-        ON CONFLICT (title) DO NOTHING;
-        """
-        cur.executemany(query, series_list)
-        conn.commit()
-        print(f"Successfully processed {len(series_list)} records.")
-    except Exception as e:
-        if conn:
+    # Bound once: a generator would be consumed by the insert before it is counted
+    rows = list(series_list)
+    with pooled_connection() as (conn, cur):
+        try:
+            query = """
+            INSERT INTO demo_series (title, genre, seasons, rating, release_year)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (title) DO NOTHING;
+            """
+            cur.executemany(query, rows)
+            conn.commit()
+            invalidate(tables=["demo_series"])
+            print(f"Successfully processed {len(rows)} records.")
+        except Exception as e:
             conn.rollback()
-        print(f"Error during insertion: {e}")
-        raise e
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
+            print(f"Error during insertion: {e}")
+            raise e
 
 
 def update_table(title, new_value):
     """Updates a specific cell from the table"""
-    conn, cur = None, None
-    try:
-        conn, cur = get_db_connection()
-        query = "UPDATE demo_series SET rating = %s WHERE title = %s;"
-        cur.execute(query, (new_value, title))
-        conn.commit()
-        print(f"Updated {title} to rating {new_value}")
-    except Exception as e:
-        if conn:
+    with pooled_connection() as (conn, cur):
+        try:
+            query = "UPDATE demo_series SET rating = %s WHERE title = %s;"
+            cur.execute(query, (new_value, title))
+            conn.commit()
+            invalidate(tables=["demo_series"])
+            print(f"Updated {title} to rating {new_value}")
+        except Exception as e:
             conn.rollback()
-        raise e
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
+            raise e
 
 
 def delete_series(title):
     """Removes a row from the database."""
-    conn, cur = None, None
-    try:
-        conn, cur = get_db_connection()
-        query = "DELETE FROM demo_series WHERE title = %s;"
-        cur.execute(query, (title,))
-        conn.commit()
-        print(f"Deleted {title} from database.")
-    except Exception as e:
-        if conn:
+    with pooled_connection() as (conn, cur):
+        try:
+            query = "DELETE FROM demo_series WHERE title = %s;"
+            cur.execute(query, (title,))
+            conn.commit()
+            invalidate(tables=["demo_series"])
+            print(f"Deleted {title} from database.")
+        except Exception as e:
             conn.rollback()
-        raise e
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
+            raise e
 
 
 def bulk_update(updates):
     """Updates multiple records at once based on a new column(s) create in initialize_table()"""
-    conn, cur = None, None
-    try:
-        conn, cur = get_db_connection()
-        query = "UPDATE demo_series SET streaming_platform = %s WHERE title = %s;"
-        cur.executemany(query, updates)
-        conn.commit()
-        print(f"Bulk updated {len(updates)} platform records.")
-    except Exception as e:
-        if conn:
+    updates = list(updates)
+    with pooled_connection() as (conn, cur):
+        try:
+            query = "UPDATE demo_series SET streaming_platform = %s WHERE title = %s;"
+            cur.executemany(query, updates)
+            conn.commit()
+            invalidate(tables=["demo_series"])
+            print(f"Bulk updated {len(updates)} platform records.")
+        except Exception as e:
+            conn.rollback()
+            raise e
+
+
+# --- Batched, set-based variants (one statement per page instead of one per row) ---
+
+
+def _execute_pages(cur, query, rows, page_size, template=None):
+    """Runs execute_values page by page and returns the total affected row count."""
+    total = 0
+    for start in range(0, len(rows), page_size):
+        page = rows[start : start + page_size]
+        execute_values(cur, query, page, template=template, page_size=len(page))
+        total += cur.rowcount
+    return total
+
+
+def insert_series_batch(series_list, page_size=DEFAULT_PAGE_SIZE):
+    """Inserts rows with multi-row INSERT ... VALUES. Returns how many were actually inserted."""
+    rows = list(series_list)
+    with pooled_connection() as (conn, cur):
+        try:
+            query = """
+            INSERT INTO demo_series (title, genre, seasons, rating, release_year)
+            VALUES %s
+            ON CONFLICT (title) DO NOTHING;
+            """
+            inserted = _execute_pages(cur, query, rows, page_size)
+            conn.commit()
+            invalidate(tables=["demo_series"])
+            print(f"Successfully inserted {inserted} of {len(rows)} records.")
+            return inserted
+        except Exception as e:
+            conn.rollback()
+            print(f"Error during insertion: {e}")
+            raise e
+
+
+def update_table_batch(updates, page_size=DEFAULT_PAGE_SIZE):
+    """Updates the rating of many titles: updates = [(title, new_value), ...]. Returns rows updated."""
+    updates = list(updates)
+    with pooled_connection() as (conn, cur):
+        try:
+            query = """
+            UPDATE demo_series AS d SET rating = v.rating
+            FROM (VALUES %s) AS v(title, rating)
+            WHERE d.title = v.title;
+            """
+            updated = _execute_pages(
+                cur, query, updates, page_size, template="(%s, %s::NUMERIC)"
+            )
+            conn.commit()
+            invalidate(tables=["demo_series"])
+            print(f"Updated rating of {updated} records.")
+            return updated
+        except Exception as e:
+            conn.rollback()
+            raise e
+
+
+def bulk_update_batch(updates, page_size=DEFAULT_PAGE_SIZE):
+    """Same input as bulk_update ([(platform, title), ...]) sent as UPDATE ... FROM (VALUES ...)."""
+    updates = list(updates)
+    with pooled_connection() as (conn, cur):
+        try:
+            query = """
+            UPDATE demo_series AS d SET streaming_platform = v.platform
+            FROM (VALUES %s) AS v(platform, title)
+            WHERE d.title = v.title;
+            """
+            updated = _execute_pages(cur, query, updates, page_size)
+            conn.commit()
+            invalidate(tables=["demo_series"])
+            print(f"Bulk updated {updated} platform records.")
+            return updated
+        except Exception as e:
+            conn.rollback()
+            raise e
+
+
+def delete_series_batch(titles, page_size=DEFAULT_PAGE_SIZE):
+    """Removes many titles with DELETE ... WHERE title = ANY(%s). Returns rows deleted."""
+    titles = list(titles)
+    with pooled_connection() as (conn, cur):
+        try:
+            deleted = 0
+            for start in range(0, len(titles), page_size):
+                cur.execute(
+                    "DELETE FROM demo_series WHERE title = ANY(%s);",
+                    (titles[start : start + page_size],),
+                )
+                deleted += cur.rowcount
+            conn.commit()
+            invalidate(tables=["demo_series"])
+            print(f"Deleted {deleted} records from database.")
+            return deleted
+        except Exception as e:
             conn.rollback()
-        raise e
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
+            raise e
@@ -0,0 +1,148 @@
+# Read API for the EBA time series (hierarchy -> metrics -> values)
+
+import weakref
+import pandas as pd
+import psycopg2
+from psycopg2 import sql
+from .connection import pooled_connection, get_db_config
+from .cache import cached_read
+
+# Names of the statements already prepared on each (pooled) connection
+_PREPARED = weakref.WeakKeyDictionary()
+
+# Metric lookup by name, hierarchy path pattern and country code.
+# The path of a metric is its node's materialized path (hierarchy.path, see the EBA
+# migrations) plus its own name, e.g. EBA_Metrics/NPE_ratio/EBA.NPE_ratio.ES,
+# and the country is the last part of the name.
+RESOLVE_METRICS_SQL = """
+    SELECT m.id, m.name
+    FROM metrics m
+    LEFT JOIN hierarchy h ON h.id = m.hierarchy_id
+    WHERE ($1::TEXT[] IS NULL OR m.name = ANY($1))
+      AND ($2::TEXT IS NULL OR COALESCE(h.path || '/', '') || m.name LIKE $2)
+      AND ($3::TEXT[] IS NULL OR substring(m.name FROM '[^.]+$') = ANY($3))
+    ORDER BY m.name
+"""
+
+# Every metric below a node, walking the adjacency list in one recursive query
+SUBTREE_METRICS_SQL = """
+    WITH RECURSIVE subtree AS (
+        SELECT id FROM hierarchy WHERE path = %s
+        UNION ALL
+        SELECT h.id FROM hierarchy h JOIN subtree s ON h.parent_id = s.id
+    )
+    SELECT m.id, m.name, h.path
+    FROM subtree s
+    JOIN metrics m ON m.hierarchy_id = s.id
+    JOIN hierarchy h ON h.id = s.id
+    ORDER BY h.path, m.name;
+"""
+
+
+def execute_prepared(cur, name, query, param_types, params):
+    """
+    Runs 'query' as a server-side prepared statement, preparing it the first time
+    it is used on this connection. Placeholders in 'query' are $1, $2, ...
+    """
+    prepared = _PREPARED.setdefault(cur.connection, set())
+    if name not in prepared:
+        cur.execute(f"PREPARE {name} ({', '.join(param_types)}) AS {query}")
+        prepared.add(name)
+    placeholders = ", ".join(["%s"] * len(params))
+    try:
+        cur.execute(f"EXECUTE {name} ({placeholders})", params)
+    except psycopg2.errors.InvalidSqlStatementName:
+        # The session lost the statement (e.g. the server reset it): prepare again
+        cur.connection.rollback()
+        prepared.discard(name)
+        execute_prepared(cur, name, query, param_types, params)
+
+
+def _glob_to_like(pattern):
+    """Turns 'EBA_Metrics/NPE_ratio/*' into a LIKE pattern ('*' and '?' are wildcards)."""
+    escaped = pattern.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped.replace("*", "%").replace("?", "_")
+
+
+def _as_list(value):
+    if value is None:
+        return None
+    return [value] if isinstance(value, str) else list(value)
+
+
+def resolve_metrics(cur, metrics=None, path=None, countries=None):
+    """Returns [(metric_id, name)] matching every given filter (None means no filter)."""
+    execute_prepared(
+        cur,
+        "resolve_metrics",
+        RESOLVE_METRICS_SQL,
+        ["TEXT[]", "TEXT", "TEXT[]"],
+        (_as_list(metrics), _glob_to_like(path) if path else None, _as_list(countries)),
+    )
+    return cur.fetchall()
+
+
+def resolve_subtree(cur, root_path):
+    """Returns [(metric_id, name, node_path)] for every metric under 'root_path' (e.g. 'EBA_Metrics')."""
+    cur.execute(SUBTREE_METRICS_SQL, (root_path.strip("/"),))
+    return cur.fetchall()
+
+
+def get_series(metrics=None, path=None, countries=None, start=None, end=None, target_db=None):
+    """
+    Fetches many series in one query and returns a wide DataFrame: one row per date,
+    one column per metric name. Filtering and pivoting run in PostgreSQL.
+
+        get_series(path="EBA_Metrics/NPE_ratio/*", countries=["ES", "EU"], start="2020-01-01")
+
+    Results go through the query cache when it is enabled (see database.cache).
+    """
+    key = (
+        "get_series",
+        get_db_config(target_db).dbname,
+        tuple(_as_list(metrics) or ()),
+        path,
+        tuple(_as_list(countries) or ()),
+        str(start) if start else None,
+        str(end) if end else None,
+    )
+    return cached_read(
+        key, lambda: _load_series(metrics, path, countries, start, end, target_db)
+    )
+
+
+def _load_series(metrics, path, countries, start, end, target_db):
+    """Runs the lookup + pivot; returns (DataFrame, cache tags)."""
+    tags = ["table:values", "table:metrics", "table:hierarchy"]
+    with pooled_connection(target_db=target_db) as (conn, cur):
+        # 1. Resolve which metrics are requested
+        found = resolve_metrics(cur, metrics, path, countries)
+        if not found:
+            return pd.DataFrame(index=pd.DatetimeIndex([], name="date")), tags
+
+        # 2. Pivot on the server: one filtered aggregate per metric
+        columns = [
+            sql.SQL("MAX(v.value) FILTER (WHERE v.metric_id = {}) AS {}").format(
+                sql.Literal(metric_id), sql.Identifier(name)
+            )
+            for metric_id, name in found
+        ]
+        query = sql.SQL(
+            """
+            SELECT v.date, {columns}
+            FROM values v
+            WHERE v.metric_id = ANY(%s)
+              AND (%s::DATE IS NULL OR v.date >= %s::DATE)
+              AND (%s::DATE IS NULL OR v.date <= %s::DATE)
+            GROUP BY v.date
+            ORDER BY v.date;
+        """
+        ).format(columns=sql.SQL(", ").join(columns))
+        cur.execute(query, ([metric_id for metric_id, _ in found], start, start, end, end))
+
+        names = [desc[0] for desc in cur.description]
+        df = pd.DataFrame(cur.fetchall(), columns=names)
+
+    df["date"] = pd.to_datetime(df["date"])
+    tags += [f"metric:{metric_id}" for metric_id, _ in found]
+    return df.set_index("date").astype("float64"), tags
@@ -0,0 +1,198 @@
+# Columnar in-memory store for many EBA series, filled from a binary COPY stream
+#
+# Instead of one Python tuple per value, a pull is kept as three contiguous NumPy arrays
+# (metric id, date, value) sorted by metric and date, plus the [start, stop) slice of each
+# metric. A million points take ~16 MB instead of the ~130 MB of fetchall() tuples.
+
+import io
+import numpy as np
+import pandas as pd
+from .connection import pooled_connection, get_db_config
+from .cache import cached_read
+from .series import resolve_metrics, _as_list
+
+# Days between 1970-01-01 (NumPy/Arrow epoch) and 2000-01-01 (PostgreSQL epoch)
+_PG_EPOCH_DAYS = 10957
+
+_COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+
+# One binary COPY tuple of (metric_id INT4, date DATE, value FLOAT8) without NULLs:
+# field count, then (length, data) per field, all big-endian
+_COPY_ROW = np.dtype(
+    [
+        ("fields", ">i2"),
+        ("metric_len", ">i4"),
+        ("metric_id", ">i4"),
+        ("date_len", ">i4"),
+        ("date", ">i4"),
+        ("value_len", ">i4"),
+        ("value", ">f8"),
+    ]
+)
+
+# NULL values come back as NaN so every row has the same width
+SERIES_COPY_SQL = """
+    COPY (
+        SELECT v.metric_id, v.date, COALESCE(v.value, 'NaN'::FLOAT8)
+        FROM values v
+        WHERE v.metric_id = ANY(%s)
+          AND (%s::DATE IS NULL OR v.date >= %s::DATE)
+          AND (%s::DATE IS NULL OR v.date <= %s::DATE)
+        ORDER BY v.metric_id, v.date
+    ) TO STDOUT WITH (FORMAT binary)
+"""
+
+
+def parse_binary_copy(data):
+    """Decodes a binary COPY stream of (metric_id, date, value) rows into three NumPy arrays."""
+    view = memoryview(data)
+    if bytes(view[:11]) != _COPY_SIGNATURE:
+        raise ValueError("Not a binary COPY stream")
+    extension = int.from_bytes(view[15:19], "big")
+    body = view[19 + extension : len(view) - 2]  # the last two bytes are the -1 trailer
+    if len(body) % _COPY_ROW.itemsize:
+        raise ValueError("Unexpected row layout in the COPY stream")
+
+    rows = np.frombuffer(body, dtype=_COPY_ROW)
+    if len(rows) and not (rows["fields"] == 3).all():
+        raise ValueError("Unexpected row layout in the COPY stream")
+    # astype copies the big-endian fields into native, contiguous arrays
+    return (
+        rows["metric_id"].astype(np.int32),
+        (rows["date"] + _PG_EPOCH_DAYS).astype(np.int32),
+        rows["value"].astype(np.float64),
+    )
+
+
+class SeriesStore:
+    """
+    Series as contiguous arrays sorted by (metric_id, date):
+
+        metric_ids  int32
+        dates       int32 days since 1970-01-01 (datetime64[D] / Arrow date32 compatible)
+        values      float64
+
+    series(metric) returns zero-copy views of one metric's dates and values.
+    """
+
+    def __init__(self, metric_ids, dates, values, names=None):
+        self.metric_ids = np.ascontiguousarray(metric_ids, dtype=np.int32)
+        self.dates = np.ascontiguousarray(dates, dtype=np.int32)
+        self.values = np.ascontiguousarray(values, dtype=np.float64)
+        self.names = dict(names or {})  # metric_id -> name
+
+        # Per-metric [start, stop) offsets from the boundaries of the sorted id column
+        starts = np.flatnonzero(np.diff(self.metric_ids)) + 1
+        bounds = np.concatenate(([0], starts, [len(self.metric_ids)]))
+        ids = self.metric_ids[bounds[:-1]] if len(self.metric_ids) else []
+        self.offsets = {
+            int(metric_id): (int(bounds[i]), int(bounds[i + 1])) for i, metric_id in enumerate(ids)
+        }
+        self._ids_by_name = {name: metric_id for metric_id, name in self.names.items()}
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, metric):
+        return self._metric_id(metric, missing=None) is not None
+
+    @property
+    def metrics(self):
+        """Metric ids present in the store, in storage order."""
+        return list(self.offsets)
+
+    @property
+    def nbytes(self):
+        return self.metric_ids.nbytes + self.dates.nbytes + self.values.nbytes
+
+    def _metric_id(self, metric, missing=KeyError):
+        metric_id = self._ids_by_name.get(metric, metric)
+        if metric_id in self.offsets:
+            return metric_id
+        if missing is KeyError:
+            raise KeyError(f"Metric '{metric}' is not in the store")
+        return missing
+
+    def series(self, metric):
+        """Returns (dates, values) views of one metric (by id or name); no data is copied."""
+        start, stop = self.offsets[self._metric_id(metric)]
+        return self.dates[start:stop], self.values[start:stop]
+
+    def copy(self):
+        return SeriesStore(self.metric_ids.copy(), self.dates.copy(), self.values.copy(), self.names)
+
+    def to_pandas(self, wide=True):
+        """
+        wide=True: one column per metric name indexed by date (like get_series()).
+        wide=False: a long (metric_id, date, value) DataFrame.
+        """
+        dates = self.dates.astype("datetime64[D]").astype("datetime64[s]")
+        if not wide:
+            return pd.DataFrame(
+                {"metric_id": self.metric_ids, "date": dates, "value": self.values}
+            )
+
+        columns = {}
+        for metric_id, (start, stop) in self.offsets.items():
+            name = self.names.get(metric_id, str(metric_id))
+            columns[name] = pd.Series(
+                self.values[start:stop], index=pd.DatetimeIndex(dates[start:stop], name="date")
+            )
+        if columns:
+            df = pd.DataFrame(columns).sort_index()
+        else:
+            df = pd.DataFrame(index=pd.DatetimeIndex([], name="date"))
+        # Every named metric gets a column (all NaN without data), in name order
+        if self.names:
+            df = df.reindex(columns=list(self.names.values())).astype("float64")
+        return df
+
+    def to_arrow(self):
+        """A pyarrow Table (metric_id, date, value) sharing the NumPy buffers (needs pyarrow)."""
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError(
+                "SeriesStore.to_arrow needs pyarrow: install the 'columnar' extra "
+                "(pip install 'database-servidor[columnar]')"
+            )
+        dates = pa.Array.from_buffers(pa.date32(), len(self.dates), [None, pa.py_buffer(self.dates)])
+        return pa.table(
+            {"metric_id": pa.array(self.metric_ids), "date": dates, "value": pa.array(self.values)}
+        )
+
+
+def copy_series(cur, metric_ids, start=None, end=None):
+    """Streams the values of 'metric_ids' through binary COPY; returns the three arrays."""
+    buffer = io.BytesIO()
+    query = cur.mogrify(SERIES_COPY_SQL, (list(metric_ids), start, start, end, end))
+    cur.copy_expert(query.decode("utf-8"), buffer)
+    return parse_binary_copy(buffer.getbuffer())
+
+
+def get_series_store(metrics=None, path=None, countries=None, start=None, end=None, target_db=None):
+    """
+    Same filters as get_series(), but returns a SeriesStore instead of a DataFrame:
+
+        store = get_series_store(path="EBA_Metrics/*")
+        dates, values = store.series("EBA.NPE_ratio.ES")
+    """
+    key = (
+        "get_series_store",
+        get_db_config(target_db).dbname,
+        tuple(_as_list(metrics) or ()),
+        path,
+        tuple(_as_list(countries) or ()),
+        str(start) if start else None,
+        str(end) if end else None,
+    )
+
+    def load():
+        tags = ["table:values", "table:metrics", "table:hierarchy"]
+        with pooled_connection(target_db=target_db) as (conn, cur):
+            found = resolve_metrics(cur, metrics, path, countries)
+            names = dict(found)
+            arrays = copy_series(cur, names, start, end) if found else ([], [], [])
+        return SeriesStore(*arrays, names=names), tags + [f"metric:{m}" for m in names]
+
+    return cached_read(key, load)
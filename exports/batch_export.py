@@ -0,0 +1,339 @@
+"""
+Batch export: many tables or queries, from several databases, in one non-interactive run.
+
+Jobs come from a YAML spec (config/export_jobs.yaml by default) and/or 'database:table'
+arguments on the command line:
+
+    output_dir: exports/batch          # relative to the project root
+    workers: 4                         # exports running at the same time
+    max_per_database: 2                # connections per database at the same time
+    defaults:
+      format: csv.gz
+    jobs:
+      - name: demo_series
+        database: demo
+        table: demo_series
+      - name: eba_values_2024
+        database: EBA
+        query: "SELECT m.name, v.date, v.value FROM values v JOIN metrics m ON m.id = v.metric_id"
+        filters:
+          date: {">=": 2024-01-01}     # scalar -> '=', list -> 'IN', {op: value} -> comparison
+        format: parquet
+      - name: eba_values_delta
+        database: EBA
+        table: values
+        incremental: true              # only rows changed since this job's last run
+
+Every output is written to a temporary file next to its target and renamed into place,
+so a reader never sees a half-written export. The run ends with a JSON manifest
+(rows, bytes and seconds per job) in the output directory. Incremental jobs read the
+changes since their stored watermark (database/change_tracking.py) and record the new
+one only after their file is in place.
+
+        python batch_export.py [jobs.yaml] [database:table ...] [--format F] [--incremental]
+                               [--workers N] [--max-per-db N]
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+from psycopg2 import sql
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+
+from database.connection import pooled_connection, project_file
+from database.change_tracking import changes_since, save_watermark
+from exports.writers import write_frame, frame_from_cursor, resolve_format, FORMATS
+from exports.export_to_excel_custom import stream_table_to_excel
+
+DEFAULT_JOBS_FILE = project_file("config", "export_jobs.yaml")
+DEFAULT_OUTPUT_DIR = BASE_DIR / "exports" / "batch"
+
+# Comparison operators allowed in {column: {op: value}} filters
+FILTER_OPERATORS = {"=", "!=", "<", "<=", ">", ">="}
+JOB_KEYS = {
+    "name", "database", "table", "query", "columns", "filters", "format", "stream", "output", "incremental"
+}
+
+
+# 1. Job spec
+def _job_name(job):
+    return job.get("name") or f"{job['database']}_{(job.get('table') or 'query').replace('.', '_')}"
+
+
+def validate_job(job):
+    """Checks one job and fills in its name and format. Raises ValueError on a bad spec."""
+    unknown = set(job) - JOB_KEYS
+    if unknown:
+        raise ValueError(f"Export job {job.get('name', job)} has unknown keys: {', '.join(sorted(unknown))}")
+    if not job.get("database"):
+        raise ValueError(f"Export job {job.get('name', job)} needs a 'database'")
+    if bool(job.get("table")) == bool(job.get("query")):
+        raise ValueError(f"Export job {job.get('name', job)} needs exactly one of 'table' or 'query'")
+    for column, condition in (job.get("filters") or {}).items():
+        if isinstance(condition, dict) and not set(condition) <= FILTER_OPERATORS:
+            raise ValueError(
+                f"Export job {job.get('name', job)}: filter on '{column}' uses an unknown operator "
+                f"(choose from {', '.join(sorted(FILTER_OPERATORS))})"
+            )
+    if job.get("incremental") and (job.get("query") or job.get("filters")):
+        raise ValueError(f"Export job {job.get('name', job)}: incremental exports need a 'table' and no 'filters'")
+    job["name"] = _job_name(job)
+    job["format"] = resolve_format(job.get("format"))
+    return job
+
+
+def load_jobs(path=None, targets=(), overrides=None):
+    """
+    Reads the YAML spec at 'path' (if any) and adds one job per 'database:table' target.
+    'overrides' (e.g. {"format": "parquet"}) apply to every job. Returns (settings, jobs).
+    """
+    spec = {}
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            spec = yaml.safe_load(f) or {}
+
+    defaults = spec.get("defaults") or {}
+    jobs = [{**defaults, **job} for job in spec.get("jobs") or []]
+    for target in targets:
+        database, _, table = target.partition(":")
+        if not table:
+            raise ValueError(f"'{target}' is not a database:table export target")
+        jobs.append({**defaults, "database": database, "table": table})
+    jobs = [validate_job({**job, **(overrides or {})}) for job in jobs]
+
+    names = [job["name"] for job in jobs]
+    duplicated = sorted({name for name in names if names.count(name) > 1})
+    if duplicated:
+        raise ValueError(f"Export job names must be unique: {', '.join(duplicated)}")
+
+    settings = {key: spec[key] for key in ("output_dir", "workers", "max_per_database") if key in spec}
+    return settings, jobs
+
+
+def build_query(job):
+    """The SELECT of one job as a psycopg2.sql object plus its parameters."""
+    if job.get("table"):
+        columns = job.get("columns")
+        select = sql.SQL(", ").join(sql.Identifier(c) for c in columns) if columns else sql.SQL("*")
+        source = sql.Identifier(*job["table"].split("."))
+    else:
+        select = sql.SQL("*")
+        source = sql.SQL("({}) AS q").format(sql.SQL(job["query"].strip().rstrip(";")))
+
+    conditions, params = [], []
+    for column, condition in (job.get("filters") or {}).items():
+        if condition is None:
+            conditions.append(sql.SQL("{} IS NULL").format(sql.Identifier(column)))
+        elif isinstance(condition, list):
+            conditions.append(sql.SQL("{} = ANY(%s)").format(sql.Identifier(column)))
+            params.append(condition)
+        elif isinstance(condition, dict):
+            for op, value in condition.items():
+                conditions.append(sql.SQL("{} {} %s").format(sql.Identifier(column), sql.SQL(op)))
+                params.append(value)
+        else:
+            conditions.append(sql.SQL("{} = %s").format(sql.Identifier(column)))
+            params.append(condition)
+
+    query = sql.SQL("SELECT {} FROM {}").format(select, source)
+    if conditions:
+        query = sql.SQL("{} WHERE {}").format(query, sql.SQL(" AND ").join(conditions))
+    return query, params
+
+
+# 2. One export
+def _output_path(job, output_dir, stamp):
+    name = job.get("output") or f"{job['name']}_{stamp}"
+    path = Path(output_dir) / name
+    if not path.name.lower().endswith(FORMATS[job["format"]]):
+        path = path.with_name(path.name + FORMATS[job["format"]])
+    return path
+
+
+def run_job(job, output_dir, stamp, limits, itersize=10_000):
+    """Exports one job through a temp file + rename. Returns its manifest entry."""
+    entry = {
+        "name": job["name"],
+        "database": job["database"],
+        "source": job.get("table") or job["query"],
+        "format": job["format"],
+        "path": None,
+        "rows": 0,
+        "bytes": 0,
+        "seconds": 0.0,
+        "status": "ok",
+    }
+    final_path = _output_path(job, output_dir, stamp)
+    # Same directory as the target so the rename is atomic; keeps the extension for the writer
+    tmp_path = final_path.with_name(f".{os.getpid()}-{threading.get_ident()}-{final_path.name}")
+
+    start = time.perf_counter()
+    try:
+        if job.get("incremental"):
+            return _run_incremental_job(job, entry, output_dir, stamp, limits)
+        query, params = build_query(job)
+        # At most 'max_per_database' exports hold a connection to the same database
+        with limits[job["database"]]:
+            with pooled_connection(target_db=job["database"]) as (conn, cur):
+                if job.get("stream") and job["format"] == "xlsx":
+                    statement = cur.mogrify(query, params).decode("utf-8")
+                    rows = stream_table_to_excel(conn, job["name"], tmp_path, itersize, query=statement)
+                else:
+                    cur.execute(query, params)
+                    description = cur.description
+                    data = cur.fetchall()
+                    rows = len(data)
+                    if rows:
+                        write_frame(frame_from_cursor(data, description), tmp_path, fmt=job["format"])
+
+        entry["rows"] = rows
+        if rows:
+            os.replace(tmp_path, final_path)
+            entry["path"] = str(final_path)
+            entry["bytes"] = final_path.stat().st_size
+        else:
+            entry["status"] = "empty"
+    except Exception as e:
+        entry["status"] = "failed"
+        entry["error"] = str(e).strip()
+    finally:
+        tmp_path.unlink(missing_ok=True)
+        entry["seconds"] = round(time.perf_counter() - start, 3)
+        _print_entry(entry)
+    return entry
+
+
+def _run_incremental_job(job, entry, output_dir, stamp, limits):
+    """Changes since the job's watermark; the new watermark is saved once the file is in place."""
+    consumer = f"batch_export:{job['name']}"
+    with limits[job["database"]]:
+        changes = changes_since(
+            job["table"], consumer=consumer, columns=job.get("columns"), target_db=job["database"]
+        )
+    entry.update(rows=len(changes.rows), deleted=len(changes.deleted), since=changes.since)
+    if len(changes):
+        # The watermark in the name keeps several runs of the same day apart
+        output = job.get("output") or f"{job['name']}_{stamp}_{changes.watermark}"
+        final_path = _output_path({**job, "output": output}, output_dir, stamp)
+        tmp_path = final_path.with_name(f".{os.getpid()}-{threading.get_ident()}-{final_path.name}")
+        try:
+            write_frame(changes.to_frame(), tmp_path, fmt=job["format"])
+            os.replace(tmp_path, final_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        entry["path"] = str(final_path)
+        entry["bytes"] = final_path.stat().st_size
+    else:
+        entry["status"] = "empty"
+    save_watermark(consumer, job["table"], changes.watermark, target_db=job["database"])
+    entry["watermark"] = changes.watermark
+    return entry
+
+
+def _print_entry(entry):
+    icon = {"ok": "✅", "empty": "⚠️", "failed": "❌"}[entry["status"]]
+    detail = entry.get("error") or f"{entry['rows']:,} rows"
+    if "deleted" in entry:
+        detail += f", {entry['deleted']:,} deleted"
+    print(f"{icon} {entry['name']} ({entry['database']}): {detail} in {entry['seconds']:.2f}s")
+
+
+# 3. The batch
+def _write_json_atomic(data, path):
+    tmp_path = path.with_name(f".{os.getpid()}-{path.name}")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+def run_batch(jobs, output_dir=None, workers=4, max_per_database=2):
+    """
+    Runs the export jobs on a pool of 'workers' threads, with at most 'max_per_database'
+    of them connected to the same database, and writes manifest_<timestamp>.json.
+    Returns the manifest.
+    """
+    output_dir = Path(output_dir or DEFAULT_OUTPUT_DIR)
+    if not output_dir.is_absolute():
+        output_dir = BASE_DIR / output_dir
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    started = datetime.now()
+    stamp = started.strftime("%Y-%m-%d")
+    limits = {job["database"]: threading.BoundedSemaphore(max_per_database) for job in jobs}
+
+    print(f"🚀 Exporting {len(jobs)} jobs ({workers} workers, {max_per_database} per database)...")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        entries = list(pool.map(lambda job: run_job(job, output_dir, stamp, limits), jobs))
+
+    manifest = {
+        "started_at": started.isoformat(timespec="seconds"),
+        "seconds": round(time.perf_counter() - start, 3),
+        "output_dir": str(output_dir),
+        "jobs": entries,
+    }
+    manifest_path = output_dir / f"manifest_{started.strftime('%Y-%m-%d_%H%M%S')}.json"
+    _write_json_atomic(manifest, manifest_path)
+
+    failed = sum(1 for entry in entries if entry["status"] == "failed")
+    rows = sum(entry["rows"] for entry in entries)
+    print(f"\n=== 📦 BATCH EXPORT: {len(entries) - failed}/{len(entries)} jobs, {rows:,} rows in {manifest['seconds']:.2f}s ===")
+    print(f"📍 Manifest: {manifest_path}")
+    return manifest
+
+
+def _option(argv, flag, default=None):
+    if flag in argv:
+        index = argv.index(flag)
+        if index + 1 < len(argv):
+            return argv[index + 1]
+    return default
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    flags = ("--format", "--workers", "--max-per-db", "--output-dir")
+    option_values = {_option(argv, flag) for flag in flags}
+    args = [a for a in argv if not a.startswith("--") and a not in option_values]
+
+    # A *.yaml argument is the job spec, the rest are database:table targets
+    files = [a for a in args if a.endswith((".yaml", ".yml"))]
+    targets = [a for a in args if a not in files]
+    jobs_file = files[0] if files else (None if targets else DEFAULT_JOBS_FILE)
+
+    overrides = {}
+    if "--format" in argv:
+        overrides["format"] = _option(argv, "--format")
+    if "--incremental" in argv:
+        overrides["incremental"] = True
+    try:
+        if len(files) > 1:
+            raise ValueError("pass a single job spec file")
+        settings, jobs = load_jobs(jobs_file, targets, overrides)
+    except (OSError, ValueError) as e:
+        print(f"❌ Error in the export jobs: {e}")
+        return 1
+    if not jobs:
+        print("⚠️ No export jobs to run.")
+        return 0
+
+    manifest = run_batch(
+        jobs,
+        output_dir=_option(argv, "--output-dir", settings.get("output_dir")),
+        workers=int(_option(argv, "--workers", settings.get("workers", 4))),
+        max_per_database=int(_option(argv, "--max-per-db", settings.get("max_per_database", 2))),
+    )
+    return 1 if any(entry["status"] == "failed" for entry in manifest["jobs"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
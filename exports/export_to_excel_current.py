@@ -1,4 +1,3 @@
-import pandas as pd
 import sys
 import os
 from pathlib import Path
@@ -12,13 +11,46 @@ EXPORTS_DIR = Path(__file__).resolve().parent
 sys.path.append(str(BASE_DIR))
 
 # Import your operations and the config loader to get the DB name
-from database.operations import get_all_series
-from database.connection import load_db_config
+from database.connection import load_db_config, pooled_connection
+from database.change_tracking import changes_since, save_watermark
+from exports.writers import write_frame, frame_from_cursor, parse_format_arg, resolve_format, FORMATS
 
 
-def export_database_to_excel():
-    # 3. Fetch data AND column names dynamically from SQL
-    data, columns = get_all_series()
+def export_changes(fmt="xlsx", consumer="export_to_excel_current", table_name="demo_series"):
+    """
+    Exports only the rows of demo_series changed since this consumer's last export (every
+    row the first time), plus the ids of deleted rows, then records the new watermark.
+    """
+    fmt = resolve_format(fmt)
+    changes = changes_since(table_name, consumer=consumer)
+    db_name = load_db_config().get("dbname", "unknown_db")
+    if not len(changes):
+        save_watermark(consumer, table_name, changes.watermark)
+        print(f"✅ No changes in '{db_name}.{table_name}' since the last export.")
+        return None
+
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H%M%S")
+    output_file = EXPORTS_DIR / f"changes_{db_name}_{table_name}_{timestamp}{FORMATS[fmt]}"
+    output_file = write_frame(changes.to_frame(), output_file, fmt=fmt)
+
+    # Only a written file moves the watermark forward
+    save_watermark(consumer, table_name, changes.watermark)
+    print(
+        f"🔄 {len(changes.rows)} changed and {len(changes.deleted)} deleted rows "
+        f"(watermark {changes.since} -> {changes.watermark})"
+    )
+    print(f"✅ Success! Changes exported to: {output_file}")
+    return output_file
+
+
+def export_database_to_excel(fmt="xlsx"):
+    fmt = resolve_format(fmt)
+
+    # 3. Fetch data AND column types dynamically from SQL
+    with pooled_connection() as (conn, cur):
+        cur.execute("SELECT * FROM demo_series ORDER BY id ASC;")
+        description = cur.description
+        data = cur.fetchall()
 
     if not data:
         print("⚠️ No data found to export.")
@@ -32,18 +64,28 @@ def export_database_to_excel():
     table_name = "demo_series"
     timestamp = datetime.now().strftime("%Y-%m-%d")
 
-    # Structure: current_[database]_[table]_[date].xlsx
-    filename = f"current_{db_name}_{table_name}_{timestamp}.xlsx"
+    # Structure: current_[database]_[table]_[date].<format>
+    filename = f"current_{db_name}_{table_name}_{timestamp}{FORMATS[fmt]}"
     OUTPUT_FILE = EXPORTS_DIR / filename
 
-    # 6. Create a DataFrame
-    df = pd.DataFrame(data, columns=columns)
+    # 6. Create a DataFrame with column types taken from cursor.description
+    df = frame_from_cursor(data, description)
 
-    # 7. Save to Excel
-    df.to_excel(OUTPUT_FILE, index=False, engine="openpyxl")
+    # 7. Save in the chosen format (Excel by default)
+    OUTPUT_FILE = write_frame(df, OUTPUT_FILE, fmt=fmt)
 
     print(f"✅ Success! Data exported to: {OUTPUT_FILE}")
 
 
 if __name__ == "__main__":
-    export_database_to_excel()
+    # --format xlsx|parquet|feather|csv.gz
+    # --incremental exports only what changed since the previous --incremental run
+    try:
+        fmt = resolve_format(parse_format_arg(sys.argv))
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    if "--incremental" in sys.argv:
+        export_changes(fmt=fmt)
+    else:
+        export_database_to_excel(fmt=fmt)
@@ -1,9 +1,11 @@
-import pandas as pd
 import psycopg2
 import sys
 import os
+import json
 from pathlib import Path
-from datetime import datetime
+from decimal import Decimal
+from datetime import datetime, date, time
+from concurrent.futures import ThreadPoolExecutor
 
 # 1. Setup Paths
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -11,15 +13,52 @@ EXPORTS_DIR = Path(__file__).resolve().parent
 sys.path.append(str(BASE_DIR))
 
 from database.connection import load_db_config
+from database.change_tracking import changes_since, save_watermark
+from exports.writers import write_frame, frame_from_cursor, parse_format_arg, resolve_format, FORMATS
 
+# Excel's hard limit per sheet (the header takes one of them)
+EXCEL_MAX_ROWS = 1_048_576
 
-def list_server_contents():
-    """Prints all databases and tables available to the user."""
+
+def _describe_database(db_config, db, timeout):
+    """Returns (table, estimated_rows, size_bytes, size_pretty) for every public table of one database."""
+    temp_config = db_config.copy()
+    temp_config["dbname"] = db
+    temp_config["connect_timeout"] = timeout
+    temp_config["options"] = f"-c statement_timeout={timeout * 1000}"
+    conn_inner = psycopg2.connect(**temp_config)
+    try:
+        with conn_inner.cursor() as cur_inner:
+            cur_inner.execute(
+                """
+                SELECT c.relname,
+                       c.reltuples::BIGINT,
+                       pg_total_relation_size(c.oid),
+                       pg_size_pretty(pg_total_relation_size(c.oid))
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = 'public'
+                  AND c.relkind IN ('r', 'p', 'v', 'm', 'f')
+                ORDER BY c.relname;
+            """
+            )
+            return cur_inner.fetchall()
+    finally:
+        conn_inner.close()
+
+
+def list_server_contents(max_workers=8, timeout=10):
+    """
+    Prints all databases and tables available to the user, with row estimates and sizes.
+    Databases are inspected concurrently (at most 'max_workers' connections at once,
+    'timeout' seconds each). Returns {database: tables} with an Exception for failures.
+    """
     db_config = load_db_config()
     # Connect to the default 'postgres' database to see the list of other databases
     db_config["dbname"] = "postgres"
 
     conn = None
+    contents = {}
     try:
         conn = psycopg2.connect(**db_config)
         cur = conn.cursor()
@@ -28,32 +67,31 @@ def list_server_contents():
         cur.execute("SELECT datname FROM pg_database WHERE datistemplate = false;")
         databases = [row[0] for row in cur.fetchall()]
 
+        # B. List Tables for each database
+        # We must connect to each DB specifically to see its tables, so do it in parallel
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {
+                db: pool.submit(_describe_database, db_config, db, timeout)
+                for db in databases
+            }
+            for db, future in futures.items():
+                try:
+                    contents[db] = future.result()
+                except Exception as e:
+                    contents[db] = e
+
         print("\n=== 🖥️ DATABASES ON SERVER ===")
         for db in databases:
             print(f"📁 {db}")
-
-            # B. List Tables for each database
-            # We must connect to each DB specifically to see its tables
-            try:
-                temp_config = db_config.copy()
-                temp_config["dbname"] = db
-                with psycopg2.connect(**temp_config) as conn_inner:
-                    with conn_inner.cursor() as cur_inner:
-                        cur_inner.execute(
-                            """
-                            SELECT table_name 
-                            FROM information_schema.tables 
-                            WHERE table_schema = 'public'
-                        """
-                        )
-                        tables = cur_inner.fetchall()
-                        if tables:
-                            for table in tables:
-                                print(f"   └── 📄 {table[0]}")
-                        else:
-                            print("   └── (No public tables)")
-            except Exception:
-                print("   └── ⚠️ (Access Denied/Connection Error)")
+            tables = contents[db]
+            if isinstance(tables, Exception):
+                print(f"   └── ⚠️ (Access Denied/Connection Error: {str(tables).strip()})")
+            elif tables:
+                for name, rows, _, size in tables:
+                    rows_text = f"~{rows:,} rows" if rows >= 0 else "rows unknown"
+                    print(f"   └── 📄 {name} ({rows_text}, {size})")
+            else:
+                print("   └── (No public tables)")
 
         print("=" * 30 + "\n")
 
@@ -62,14 +100,75 @@ def list_server_contents():
     finally:
         if conn:
             conn.close()
+    return contents
+
 
+def _excel_value(value):
+    """Converts one database value into something openpyxl can write."""
+    # Excel does not support timezones: keep the local time and drop the offset
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.replace(tzinfo=None)
+    # JSON/JSONB columns come back as dicts/lists
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    if value is None or isinstance(value, (str, int, float, Decimal, date, time)):
+        return value
+    return str(value)
+
+
+def stream_table_to_excel(conn, target_table, output_path, itersize=10_000, query=None):
+    """
+    Streams a table to Excel without holding it in memory: rows come from a named
+    (server-side) cursor 'itersize' at a time and go to a write-only workbook.
+    A new sheet is started whenever the current one reaches Excel's row limit.
+    'query' (SQL text or a psycopg2.sql object) replaces 'SELECT * FROM target_table';
+    target_table then only names the sheets. Returns the number of exported rows.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet, sheet_rows, total = None, 0, 0
+
+    with conn.cursor(name="export_stream") as cur:
+        cur.itersize = itersize
+        cur.execute(query or f"SELECT * FROM {target_table};")
+        for row in cur:
+            # Open a new sheet (with header) at the start and on every rollover
+            if sheet is None or sheet_rows >= EXCEL_MAX_ROWS:
+                title = f"{target_table}_{len(workbook.worksheets) + 1}"
+                sheet = workbook.create_sheet(title[-31:])
+                sheet.append([desc[0] for desc in cur.description])
+                sheet_rows = 1
+            sheet.append([_excel_value(value) for value in row])
+            sheet_rows += 1
+            total += 1
+
+    if total:
+        workbook.save(output_path)
+    return total
+
+
+def export_custom_table(
+    stream=False, itersize=10_000, fmt="xlsx", target_db=None, target_table=None, incremental=False
+):
+    # Check the options before listing the server or prompting
+    try:
+        fmt = resolve_format(fmt)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    if stream and fmt != "xlsx":
+        print(f"❌ --stream writes Excel only; drop it to export '{fmt}'.")
+        return 1
 
-def export_custom_table():
-    # Show the user what's available first
-    list_server_contents()
+    # Without a database and table, show the user what's available and ask
+    if not (target_db and target_table):
+        list_server_contents()
+        target_db = input("Enter the Database Name to export from: ").strip()
+        target_table = input("Enter the Table Name to export: ").strip()
 
-    target_db = input("Enter the Database Name to export from: ").strip()
-    target_table = input("Enter the Table Name to export: ").strip()
+    if incremental:
+        return export_table_changes(target_db, target_table, fmt)
 
     db_config = load_db_config()
     db_config["dbname"] = target_db
@@ -77,38 +176,44 @@ def export_custom_table():
     conn, cur = None, None
     try:
         conn = psycopg2.connect(**db_config)
+        timestamp = datetime.now().strftime("%Y-%m-%d")
+        filename = f"custom_{target_db}_{target_table}_{timestamp}{FORMATS[fmt]}"
+        output_path = EXPORTS_DIR / filename
+
+        # Streaming mode: bounded memory regardless of the table size (Excel only)
+        if stream:
+            total = stream_table_to_excel(conn, target_table, output_path, itersize)
+            if not total:
+                print(f"⚠️ Table '{target_table}' is empty.")
+                return 0
+            print(f"\n✅ Success! {total} rows from '{target_db}.{target_table}' exported to:")
+            print(f"📍 {output_path}")
+            return 0
+
         cur = conn.cursor()
 
         # Fetch Data and Columns
         cur.execute(f"SELECT * FROM {target_table};")
-        columns = [desc[0] for desc in cur.description]
+        description = cur.description
         data = cur.fetchall()
 
         if not data:
             print(f"⚠️ Table '{target_table}' is empty.")
-            return
+            return 0
 
-        # 1. Create DataFrame
-        df = pd.DataFrame(data, columns=columns)
-
-        # --- Clean timezones from data in order to export to Excel (timezones are not supported) ---
-        # We loop through each column to find datetimes with timezones
-        for col in df.select_dtypes(include=["datetimetz", "datetime"]):
-            # This removes the timezone (e.g., +02:00) but keeps the local time
-            df[col] = df[col].dt.tz_localize(None)
-
-        # 2. Save to Excel
-        timestamp = datetime.now().strftime("%Y-%m-%d")
-        filename = f"custom_{target_db}_{target_table}_{timestamp}.xlsx"
-        output_path = EXPORTS_DIR / filename
+        # 1. Create DataFrame with column types taken from cursor.description
+        df = frame_from_cursor(data, description)
 
-        df.to_excel(output_path, index=False, engine="openpyxl")
+        # 2. Save in the chosen format (the Excel writer drops timezones)
+        output_path = write_frame(df, output_path, fmt=fmt)
 
         print(f"\n✅ Success! Data from '{target_db}.{target_table}' exported to:")
         print(f"📍 {output_path}")
+        return 0
 
     except Exception as e:
         print(f"❌ Error during export: {e}")
+        return 1
     finally:
         if cur:
             cur.close()
@@ -116,5 +221,42 @@ def export_custom_table():
             conn.close()
 
 
+def export_table_changes(target_db, target_table, fmt="xlsx", consumer="export_to_excel_custom"):
+    """
+    Exports the rows of a change-tracked table changed since this consumer's last export
+    (see database/change_tracking.py) and records the new watermark once the file exists.
+    """
+    try:
+        changes = changes_since(target_table, consumer=consumer, target_db=target_db)
+        if not len(changes):
+            save_watermark(consumer, target_table, changes.watermark, target_db=target_db)
+            print(f"✅ No changes in '{target_db}.{target_table}' since the last export.")
+            return 0
+
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H%M%S")
+        filename = f"changes_{target_db}_{target_table}_{timestamp}{FORMATS[fmt]}"
+        output_path = write_frame(changes.to_frame(), EXPORTS_DIR / filename, fmt=fmt)
+        save_watermark(consumer, target_table, changes.watermark, target_db=target_db)
+
+        print(
+            f"\n🔄 {len(changes.rows)} changed and {len(changes.deleted)} deleted rows "
+            f"of '{target_db}.{target_table}' exported to:"
+        )
+        print(f"📍 {output_path}")
+        return 0
+    except Exception as e:
+        print(f"❌ Error during export: {e}")
+        return 1
+
+
 if __name__ == "__main__":
-    export_custom_table()
+    # --stream uses a server-side cursor and a write-only workbook for large tables
+    # --format xlsx|parquet|feather|csv.gz
+    # --incremental exports only the rows changed since the previous --incremental run
+    sys.exit(
+        export_custom_table(
+            stream="--stream" in sys.argv,
+            fmt=parse_format_arg(sys.argv),
+            incremental="--incremental" in sys.argv,
+        )
+    )
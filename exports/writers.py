@@ -0,0 +1,148 @@
+# Export writers: Excel, Parquet, Arrow/Feather and gzip CSV behind one function
+#
+# pandas is imported where a frame is built, so listing formats or parsing --format stays cheap.
+
+import json
+from pathlib import Path
+
+# Format name -> file extension
+FORMATS = {
+    "xlsx": ".xlsx",
+    "parquet": ".parquet",
+    "feather": ".feather",
+    "csv.gz": ".csv.gz",
+}
+
+# PostgreSQL type OIDs (cursor.description type_code) -> pandas dtype
+PG_TYPE_DTYPES = {
+    16: "boolean",  # bool
+    20: "Int64",  # int8
+    21: "Int64",  # int2
+    23: "Int64",  # int4
+    700: "float64",  # float4
+    701: "float64",  # float8
+    1700: "float64",  # numeric
+    25: "string",  # text
+    1042: "string",  # char
+    1043: "string",  # varchar
+    1082: "datetime",  # date
+    1114: "datetime",  # timestamp
+    1184: "datetimetz",  # timestamptz
+    114: "json",  # json
+    3802: "json",  # jsonb
+}
+
+
+def parse_format_arg(argv, default="xlsx"):
+    """Reads '--format <name>' from the command line arguments."""
+    if "--format" in argv:
+        index = argv.index("--format")
+        if index + 1 < len(argv):
+            return argv[index + 1].lower()
+    return default
+
+
+def resolve_format(fmt=None, output_path=None):
+    """Picks the format from the explicit name or, failing that, the file extension."""
+    if fmt:
+        fmt = fmt.lower().lstrip(".")
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format '{fmt}'. Choose from: {', '.join(FORMATS)}")
+        return fmt
+    name = Path(output_path).name.lower() if output_path else ""
+    for candidate, extension in FORMATS.items():
+        if name.endswith(extension):
+            return candidate
+    return "xlsx"
+
+
+def _json_text(value):
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+
+def frame_from_cursor(rows, description):
+    """
+    Builds a DataFrame with typed columns from cursor.description.
+    'description' may also be a plain list of column names (types are then inferred).
+    """
+    import pandas as pd
+
+    names = [desc if isinstance(desc, str) else desc[0] for desc in description]
+    df = pd.DataFrame(rows, columns=names)
+
+    for desc in description:
+        if isinstance(desc, str):
+            continue
+        dtype = PG_TYPE_DTYPES.get(desc[1])
+        if dtype is None:
+            continue
+        try:
+            if dtype == "datetime":
+                df[desc[0]] = pd.to_datetime(df[desc[0]])
+            elif dtype == "datetimetz":
+                df[desc[0]] = pd.to_datetime(df[desc[0]], utc=True)
+            elif dtype == "json":
+                # psycopg2 returns dicts/lists: keep the JSON text (Parquet can't store an
+                # empty struct and each row may have different keys)
+                df[desc[0]] = df[desc[0]].map(_json_text, na_action="ignore").astype("string")
+            else:
+                df[desc[0]] = df[desc[0]].astype(dtype)
+        except (TypeError, ValueError):
+            # Keep whatever pandas inferred if the values don't fit the mapping
+            pass
+    return df
+
+
+def _require_pyarrow(fmt):
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError(
+            f"Exporting to {fmt} needs pyarrow: install the 'columnar' extra "
+            "(pip install 'database-servidor[columnar]')"
+        )
+
+
+def write_excel(df, output_path, **_):
+    # --- Clean timezones from data in order to export to Excel (timezones are not supported) ---
+    for col in df.select_dtypes(include=["datetimetz"]):
+        # This removes the timezone (e.g., +02:00) but keeps the local time
+        df[col] = df[col].dt.tz_localize(None)
+    df.to_excel(output_path, index=False, engine="openpyxl")
+
+
+def write_parquet(df, output_path, compression="zstd", **_):
+    _require_pyarrow("Parquet")
+    df.to_parquet(output_path, index=False, compression=compression)
+
+
+def write_feather(df, output_path, compression="zstd", **_):
+    _require_pyarrow("Feather")
+    df.reset_index(drop=True).to_feather(output_path, compression=compression)
+
+
+def write_csv_gz(df, output_path, **_):
+    df.to_csv(output_path, index=False, compression="gzip")
+
+
+WRITERS = {
+    "xlsx": write_excel,
+    "parquet": write_parquet,
+    "feather": write_feather,
+    "csv.gz": write_csv_gz,
+}
+
+
+def write_frame(df, output_path, fmt=None, compression=None):
+    """
+    Writes the DataFrame in the requested format. The output path gets the
+    format's extension if it doesn't already have it. Returns the final path.
+    """
+    fmt = resolve_format(fmt, output_path)
+    output_path = Path(output_path)
+    if not output_path.name.lower().endswith(FORMATS[fmt]):
+        output_path = output_path.with_name(output_path.name + FORMATS[fmt])
+
+    options = {"compression": compression} if compression else {}
+    WRITERS[fmt](df, output_path, **options)
+    return output_path
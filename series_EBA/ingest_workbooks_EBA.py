@@ -0,0 +1,253 @@
+"""
+Parallel ingestion of several EBA workbooks into the "values" table.
+
+Workbooks are parsed in a process pool. Every sheet with a layout in the 'mapping' section
+of estructura_EBA.yaml (by sheet name, or '*' for any sheet with the mapped columns) is
+normalized into (metric, date, value) records; other sheets (dictionaries, lists of
+series) are skipped.
+Parsed records go through a bounded queue to a loader thread that writes them in batched
+transactions (COPY + upsert, see upload_series_EBA.copy_and_merge), so Excel parsing and
+database I/O overlap. The run ends with a per-file throughput summary; rows that could not
+be loaded (unparseable values, bad periods, duplicates, metrics missing from the database)
+are counted there and written to series_EBA/rejected/ like upload_series_EBA does.
+
+        python ingest_workbooks_EBA.py [target_db] [--source <dir or glob>] [--workers N] [--batch-size N]
+"""
+
+import sys
+import glob
+import time
+import queue
+import threading
+import multiprocessing
+import pandas as pd
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+
+from database.connection import pooled_connection
+from database.cache import invalidate
+from database.aggregations import refresh_aggregate_views
+from series_EBA.upload_series_EBA import (
+    YAML_FILE,
+    load_metric_ids,
+    copy_and_merge,
+    write_rejects_report,
+)
+from series_EBA.mapping import REJECT_COLUMNS, load_mapping
+from series_EBA.workbook_cache import WorkbookCache
+
+DEFAULT_SOURCE = Path(__file__).parent / "excels_raw_EBA"
+
+# Marks the end of the stream for the loader thread
+_DONE = object()
+
+
+def find_workbooks(source):
+    """Expands a directory or a glob pattern into a sorted list of .xlsx files."""
+    source = Path(source)
+    if source.is_dir():
+        return sorted(source.glob("*.xlsx"))
+    return sorted(Path(p) for p in glob.glob(str(source)))
+
+
+def _reject_rows(records, reason):
+    """(name, date, value) records as rejected rows (see mapping.REJECT_COLUMNS)."""
+    return pd.DataFrame(
+        {
+            "name": records["name"],
+            "period": pd.to_datetime(records["date"]).dt.strftime("%Y%m"),
+            "raw_value": records["value"],
+            "reason": reason,
+        },
+        columns=REJECT_COLUMNS,
+    )
+
+
+def _read_and_normalize(path):
+    """
+    One frame per workbook (so it fits the parsed-workbook cache): the (name, date, value)
+    records, then the rejected rows with their period, raw_value and reason filled in.
+    """
+    mapping = load_mapping(YAML_FILE)
+    frames, rejects = [], []
+    for sheet, df in pd.read_excel(path, sheet_name=None).items():
+        plan = mapping.plan_for(sheet, df)
+        if plan is not None:
+            usable, rejected = plan.apply(df)
+            frames.append(usable)
+            rejects.append(rejected)
+    if frames:
+        records = pd.concat(frames, ignore_index=True)
+        duplicated = records.duplicated(subset=["name", "date"], keep="last")
+        rejects.append(_reject_rows(records[duplicated], "duplicate row (kept the last one)"))
+        records = records[~duplicated]
+    else:
+        records = pd.DataFrame(columns=["name", "date", "value"])
+    rejected = pd.concat(rejects, ignore_index=True) if rejects else pd.DataFrame(columns=REJECT_COLUMNS)
+    # Raw values mix text and numbers: keep them as text so the frame can be cached as Feather
+    rejected["raw_value"] = rejected["raw_value"].astype(str)
+    return pd.concat([records, rejected], ignore_index=True)
+
+
+def parse_workbook(path):
+    """
+    Runs in a worker process: reads every sheet of one workbook and returns the
+    normalized (name, date, value) records, the rejected rows and the parse time in
+    seconds. Unchanged workbooks are served from the parsed-workbook cache.
+    """
+    start = time.perf_counter()
+    # The variant changes with the mapping, so editing a layout re-parses the workbooks
+    variant = f"normalized-rejects-{load_mapping(YAML_FILE).digest}"
+    parsed = WorkbookCache().get_or_parse(path, variant, _read_and_normalize)
+    is_rejected = parsed["reason"].notna()
+    records = parsed.loc[~is_rejected, ["name", "date", "value"]].reset_index(drop=True)
+    rejected = parsed.loc[is_rejected, REJECT_COLUMNS].reset_index(drop=True)
+    return records, rejected, time.perf_counter() - start
+
+
+def _loader(target_db, batches, stats, rejects, errors):
+    """
+    Consumes batches from the queue and commits one transaction per batch. Records of
+    metrics missing from the database are added to rejects[file_name].
+    """
+    try:
+        with pooled_connection(target_db=target_db) as (conn, cur):
+            metric_ids = load_metric_ids(cur)
+            while True:
+                item = batches.get()
+                if item is _DONE:
+                    break
+                file_name, batch = item
+                start = time.perf_counter()
+                batch = batch.merge(metric_ids, on="name", how="left")
+                unknown = batch["metric_id"].isna()
+                if unknown.any():
+                    rejects[file_name].append(_reject_rows(batch[unknown], "metric not in database"))
+                    stats[file_name]["rejected"] += int(unknown.sum())
+                    batch = batch[~unknown].astype({"metric_id": "int64"})
+                if not batch.empty:
+                    try:
+                        inserted, updated = copy_and_merge(cur, batch)
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+                    invalidate(metric_ids=[int(m) for m in batch["metric_id"].unique()])
+                    stats[file_name]["inserted"] += inserted
+                    stats[file_name]["updated"] += updated
+                stats[file_name]["loaded"] += len(batch)
+                stats[file_name]["load_seconds"] += time.perf_counter() - start
+
+            # Bring the aggregate views (if any) up to date once everything is loaded
+            if refresh_aggregate_views(cur):
+                conn.commit()
+                invalidate(tables=["values"])
+    except Exception as e:
+        errors.append(e)
+        # Keep draining so the producer never blocks on a full queue
+        while batches.get() is not _DONE:
+            pass
+
+
+def run_pipeline(source, target_db=None, workers=4, batch_size=50_000, queue_size=8):
+    """
+    Parses the workbooks in parallel and loads them as they arrive, then prints per-file stats
+    and writes the rejected rows report. Returns 0, or 1 if a workbook could not be parsed
+    or loaded.
+    """
+    workbooks = find_workbooks(source)
+    if not workbooks:
+        print(f"⚠️ No workbooks found in '{source}'.")
+        return 0
+
+    stats = {
+        path.name: {"parsed": 0, "loaded": 0, "inserted": 0, "updated": 0, "rejected": 0,
+                    "parse_seconds": 0.0, "load_seconds": 0.0}
+        for path in workbooks
+    }
+    rejects = {path.name: [] for path in workbooks}
+    batches = queue.Queue(maxsize=queue_size)
+    errors = []
+    parse_failed = False
+    loader = threading.Thread(target=_loader, args=(target_db, batches, stats, rejects, errors))
+    loader.start()
+
+    # 1. Parse in worker processes and hand batches to the loader as each file finishes.
+    # Workers are spawned, not forked: a fork would copy the running loader thread and its
+    # open connection, which the children could then close at exit (close_all_pools)
+    try:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = {pool.submit(parse_workbook, path): path for path in workbooks}
+            for future in as_completed(futures):
+                name = futures[future].name
+                try:
+                    records, rejected, seconds = future.result()
+                except Exception as e:
+                    print(f"❌ Could not parse {name}: {e}")
+                    parse_failed = True
+                    continue
+                stats[name]["parsed"] = len(records)
+                stats[name]["parse_seconds"] = seconds
+                if len(rejected):
+                    rejects[name].append(rejected)
+                    stats[name]["rejected"] += len(rejected)
+                print(f"📖 Parsed {name}: {len(records)} records in {seconds:.2f}s")
+                for offset in range(0, len(records), batch_size):
+                    batches.put((name, records.iloc[offset : offset + batch_size]))
+    finally:
+        batches.put(_DONE)
+        loader.join()
+
+    if errors:
+        print(f"❌ Error while loading: {errors[0]}")
+
+    # 2. Throughput summary per file
+    print("\n=== 📊 INGESTION SUMMARY ===")
+    for name, row in stats.items():
+        total = row["parse_seconds"] + row["load_seconds"]
+        rate = row["loaded"] / total if total else 0
+        print(
+            f"📄 {name}: {row['parsed']} parsed, {row['loaded']} loaded "
+            f"({row['inserted']} inserted, {row['updated']} updated), {row['rejected']} rejected | "
+            f"parse {row['parse_seconds']:.2f}s, load {row['load_seconds']:.2f}s, "
+            f"{rate:,.0f} rows/s"
+        )
+    print("=" * 30 + "\n")
+
+    # 3. One rejected-rows report for the run, with the workbook of every row
+    frames = [
+        frame.assign(file=name)[["file", *REJECT_COLUMNS]]
+        for name, file_rejects in rejects.items()
+        for frame in file_rejects
+    ]
+    if frames:
+        write_rejects_report(pd.concat(frames, ignore_index=True), target_db)
+    return 1 if errors or parse_failed else 0
+
+
+def _option(argv, flag, default):
+    if flag in argv and argv.index(flag) + 1 < len(argv):
+        return argv[argv.index(flag) + 1]
+    return default
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    source = _option(argv, "--source", str(DEFAULT_SOURCE))
+    workers = int(_option(argv, "--workers", 4))
+    batch_size = int(_option(argv, "--batch-size", 50_000))
+
+    # First positional argument (not an option value) is the target database
+    option_values = {_option(argv, flag, None) for flag in ("--source", "--workers", "--batch-size")}
+    args = [a for a in argv if not a.startswith("--") and a not in option_values]
+    target_db = args[0] if args else None
+
+    return run_pipeline(source, target_db=target_db, workers=workers, batch_size=batch_size)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
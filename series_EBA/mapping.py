@@ -0,0 +1,195 @@
+"""
+Declarative sheet layouts for the value loaders.
+
+The 'mapping' section of estructura_EBA.yaml describes, per sheet, which columns hold the
+period, the value and the parts of the metric name. It is compiled once into a LoadPlan
+that turns a whole sheet into (name, date, value) records with vectorized pandas
+operations, so another regulator's workbook only needs a new mapping entry:
+
+    mapping:
+      KRIs_by_country_and_EU:            # sheet name, or "*" for any sheet with these columns
+        columns: {period: periodo, country: pais, metric: metric, value: valor}
+        name: "EBA.{metric}.{country}"    # metric name template over the column fields
+        period_format: "%Y%m"
+        percent_strings: true             # '6,5%' -> 0.065 (any string value is a percent)
+        scale: 1                          # multiplies numeric values
+        lookups:                          # optional: translate source labels
+          metric:
+            file: excels_raw_EBA/diccionario_EBA_series_df.xlsx
+            sheet: listado_nombres_Yahoo
+            key: codigo_serie
+            value: nombre
+"""
+
+import string
+import hashlib
+import json
+import yaml
+import pandas as pd
+from pathlib import Path
+
+# Top-level key of the mapping section (not part of the hierarchy tree)
+MAPPING_KEY = "mapping"
+
+# Layout of 'KRIs_by_country_and_EU', used when the YAML has no mapping section
+DEFAULT_MAPPING = {
+    "*": {
+        "columns": {"period": "periodo", "country": "pais", "metric": "metric", "value": "valor"},
+        "name": "EBA.{metric}.{country}",
+        "period_format": "%Y%m",
+        "percent_strings": True,
+    }
+}
+
+REJECT_COLUMNS = ["name", "period", "raw_value", "reason"]
+
+
+class LoadPlan:
+    """One compiled sheet layout: apply(df) -> (records, rejected)."""
+
+    def __init__(self, sheet, spec, base_dir=None):
+        self.sheet = sheet
+        self.columns = dict(spec["columns"])
+        for field in ("period", "value"):
+            if field not in self.columns:
+                raise ValueError(f"Mapping for '{sheet}' needs a '{field}' column")
+
+        # Split the name template once into literal text and column fields
+        self.name_parts = []
+        for literal, field, _, _ in string.Formatter().parse(spec["name"]):
+            if literal:
+                self.name_parts.append((False, literal))
+            if field is not None:
+                if field not in self.columns:
+                    raise ValueError(f"Mapping for '{sheet}' uses '{{{field}}}' but has no such column")
+                self.name_parts.append((True, field))
+
+        self.period_format = spec.get("period_format")
+        self.percent_strings = bool(spec.get("percent_strings", False))
+        self.scale = float(spec.get("scale", 1))
+        self.lookups = {
+            field: _load_lookup(lookup, base_dir) for field, lookup in (spec.get("lookups") or {}).items()
+        }
+
+    @property
+    def required_columns(self):
+        return set(self.columns.values())
+
+    def matches(self, df):
+        return self.required_columns.issubset(df.columns)
+
+    def apply(self, df):
+        """
+        Turns a sheet into (name, date, value) records and a DataFrame of rejected rows
+        (name, period, raw_value, reason): invalid periods, unparseable values, labels
+        missing from a lookup and duplicated (name, date) rows (the last one is kept).
+        Empty values are dropped without being rejected.
+        """
+        reasons = pd.Series(pd.NA, index=df.index, dtype="object")
+
+        # 1. Translate labels through the lookups, then build names from the template
+        fields = {}
+        for field, column in self.columns.items():
+            values = df[column]
+            if field in self.lookups:
+                mapped = values.map(self.lookups[field])
+                reasons[mapped.isna() & values.notna()] = f"no {field} in lookup"
+                values = mapped
+            fields[field] = values
+        names = pd.Series("", index=df.index, dtype="object")
+        for is_field, part in self.name_parts:
+            names = names + (fields[part].astype(str) if is_field else part)
+
+        # 2. Periods
+        period = df[self.columns["period"]]
+        if self.period_format:
+            dates = pd.to_datetime(period.astype(str), format=self.period_format, errors="coerce")
+        else:
+            dates = pd.to_datetime(period, errors="coerce")
+
+        # 3. Values (strings are percents when percent_strings is on)
+        raw = df[self.columns["value"]]
+        if pd.api.types.is_numeric_dtype(raw):
+            values = raw.astype(float)
+            unparseable = pd.Series(False, index=df.index)
+        else:
+            text = raw.str.replace(",", ".", regex=False).str.replace("%", "", regex=False)
+            parsed = pd.to_numeric(text.str.strip(), errors="coerce")
+            if self.percent_strings:
+                parsed = parsed / 100
+            values = parsed.where(text.notna(), pd.to_numeric(raw, errors="coerce"))
+            filled = raw.notna() & (raw.astype(str).str.strip() != "")
+            unparseable = values.isna() & filled
+        values = values * self.scale
+
+        reasons[unparseable & reasons.isna()] = "unparseable value"
+        reasons[dates.isna()] = "invalid period"
+
+        # 4. Keep one value per (name, date)
+        out = pd.DataFrame({"name": names, "date": dates.dt.date, "value": values})
+        usable = out[reasons.isna()].dropna(subset=["value"])
+        duplicated = usable.duplicated(subset=["name", "date"], keep="last")
+        reasons[duplicated[duplicated].index] = "duplicate row (kept the last one)"
+
+        bad = reasons.notna()
+        rejected = pd.DataFrame(
+            {
+                "name": names[bad],
+                "period": period[bad].astype(str),
+                "raw_value": raw[bad],
+                "reason": reasons[bad],
+            },
+            columns=REJECT_COLUMNS,
+        )
+        return usable[~duplicated], rejected
+
+
+def _load_lookup(lookup, base_dir):
+    """A {source label: mapped label} dict, inline ('map') or from a workbook sheet."""
+    if "map" in lookup:
+        return dict(lookup["map"])
+    path = Path(lookup["file"])
+    if base_dir and not path.is_absolute():
+        path = Path(base_dir) / path
+    table = pd.read_excel(path, sheet_name=lookup.get("sheet", 0))
+    table = table.dropna(subset=[lookup["key"], lookup["value"]])
+    return dict(zip(table[lookup["key"]], table[lookup["value"]]))
+
+
+class Mapping:
+    """The compiled mapping section: one LoadPlan per sheet name (plus an optional '*')."""
+
+    def __init__(self, spec, base_dir=None):
+        self.spec = spec
+        self.plans = {sheet: LoadPlan(sheet, layout, base_dir) for sheet, layout in spec.items()}
+        # Identifies the layout, e.g. for caches of normalized records
+        self.digest = hashlib.sha1(json.dumps(spec, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+    def plan_for(self, sheet, df=None):
+        """The plan of 'sheet', or the '*' plan when df has its columns; None if nothing fits."""
+        plan = self.plans.get(sheet)
+        if plan is None:
+            plan = self.plans.get("*")
+        if plan is not None and df is not None and not plan.matches(df):
+            return None
+        return plan
+
+
+# Compiled mappings per YAML file, recompiled when the file's mtime changes
+_MAPPINGS = {}
+
+
+def load_mapping(yaml_path):
+    """Reads and compiles the mapping section of 'yaml_path' (DEFAULT_MAPPING if it has none)."""
+    yaml_path = Path(yaml_path)
+    key = (str(yaml_path), yaml_path.stat().st_mtime_ns)
+    if key not in _MAPPINGS:
+        with open(yaml_path, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
+        _MAPPINGS[key] = Mapping(data.get(MAPPING_KEY) or DEFAULT_MAPPING, base_dir=yaml_path.parent)
+    return _MAPPINGS[key]
+
+
+def hierarchy_section(data):
+    """The YAML tree without the mapping section (what the hierarchy sync walks)."""
+    return {key: value for key, value in (data or {}).items() if key != MAPPING_KEY}
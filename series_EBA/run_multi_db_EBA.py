@@ -0,0 +1,73 @@
+"""
+Runs the EBA hierarchy sync and value upload against several databases at the same time.
+
+The workbook is read once; then every target database gets its own task (sync, then
+upload), so the whole run takes roughly as long as the slowest database.
+
+        python run_multi_db_EBA.py <db1> <db2> ... [--incremental] [--check-changes] [--max-parallel N]
+"""
+
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+
+from series_EBA.series_hierarchy_metric_EBA import sync_database
+from series_EBA.upload_series_EBA import read_source, upload_database
+
+
+async def process_database(target_db, df, semaphore, options):
+    """Sync + upload for one database. Returns (target_db, error or None, seconds)."""
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(sync_database, target_db)
+            await asyncio.to_thread(upload_database, target_db, df, **options)
+            return target_db, None, time.perf_counter() - start
+        except Exception as e:
+            return target_db, e, time.perf_counter() - start
+
+
+async def run_all(targets, options, max_parallel=8):
+    df = await asyncio.to_thread(read_source)
+    semaphore = asyncio.Semaphore(max_parallel)
+    results = await asyncio.gather(
+        *(process_database(db, df, semaphore, options) for db in targets)
+    )
+
+    print("\n=== 🗂️ MULTI-DATABASE RUN ===")
+    for target_db, error, seconds in results:
+        if error:
+            print(f"❌ {target_db}: {error} ({seconds:.1f}s)")
+        else:
+            print(f"✅ {target_db}: done in {seconds:.1f}s")
+    print("=" * 30 + "\n")
+    return results
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    max_parallel = 8
+    if "--max-parallel" in argv:
+        index = argv.index("--max-parallel")
+        max_parallel = int(argv[index + 1])
+        del argv[index : index + 2]
+
+    targets = [a for a in argv if not a.startswith("--")]
+    if not targets:
+        print("Usage: python run_multi_db_EBA.py <db1> <db2> ... [--incremental] [--max-parallel N]")
+        return 1
+
+    options = {
+        "incremental": "--incremental" in argv,
+        "check_changes": "--check-changes" in argv,
+    }
+    results = asyncio.run(run_all(targets, options, max_parallel))
+    return 1 if any(error for _, error, _ in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,23 +3,135 @@ This script focuses on the structure. It ensures the tables exist and maps the "
 It reads from 'estructura_EBA.yaml' and populates the hierarchy and metrics tables in the PostgreSQL database.
 
 in config > database.yaml choose
+
+Pass --partitioned to keep "values" as a table partitioned by year (BRIN index on date,
+one UNIQUE(metric_id, date) per partition); an existing table is converted in place and
+new yearly partitions are created automatically when values are uploaded:
+
+        python series_hierarchy_metric_EBA.py [target_db] [--partitioned]
+
+Pass --aggregate-views to create the materialized views behind database.aggregations
+(resampled values and cross-country stats); uploads refresh them when they exist.
+
+hierarchy, metrics and values track their changes (updated_at, change_xid and a log of
+deleted keys, see database/change_tracking.py) for incremental exports.
 """
 
-import json
 import yaml
 import sys
 from pathlib import Path
 from typing import Optional, Dict, Any
+from psycopg2.extras import execute_values, Json
 
 # Setup paths
 BASE_DIR = Path(__file__).resolve().parent.parent
 sys.path.append(str(BASE_DIR))
 
-from database.connection import get_db_connection
+from database.connection import pooled_connection
+from database.cache import invalidate
+from database.migrations import apply_migrations
+from database.change_tracking import change_tracking_statements, enable_change_tracking, has_change_tracking
+from database.aggregations import create_aggregate_views, drop_aggregate_views
+from database.instrumentation import span, get_instrumentation, enable_instrumentation
+from series_EBA.mapping import hierarchy_section
 
+# Schema upgrades for existing EBA databases, applied in order by create_eba_schema()
+EBA_MIGRATIONS = [
+    (
+        1,
+        "indexes and unique keys for hierarchy/metrics",
+        [
+            # Merge duplicated metric names into the lowest id before making names unique
+            """
+            CREATE TEMP TABLE metric_dupes ON COMMIT DROP AS
+            SELECT id, MIN(id) OVER (PARTITION BY name) AS keep_id FROM metrics;
+            """,
+            """
+            UPDATE values v SET metric_id = d.keep_id
+            FROM metric_dupes d
+            WHERE v.metric_id = d.id AND d.id <> d.keep_id
+              AND NOT EXISTS (
+                  SELECT 1 FROM values v2 WHERE v2.metric_id = d.keep_id AND v2.date = v.date
+              );
+            """,
+            "DELETE FROM values v USING metric_dupes d WHERE v.metric_id = d.id AND d.id <> d.keep_id;",
+            "DELETE FROM metrics m USING metric_dupes d WHERE m.id = d.id AND d.id <> d.keep_id;",
+            "ALTER TABLE metrics ADD CONSTRAINT metrics_name_key UNIQUE (name);",
+            "CREATE INDEX IF NOT EXISTS metrics_hierarchy_id_idx ON metrics (hierarchy_id);",
+            "CREATE INDEX IF NOT EXISTS hierarchy_parent_id_idx ON hierarchy (parent_id);",
+            # One node per (name, parent); root nodes have a NULL parent
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS hierarchy_name_parent_key
+            ON hierarchy (name, COALESCE(parent_id, 0));
+            """,
+        ],
+    ),
+    (
+        2,
+        "materialized hierarchy path",
+        [
+            "ALTER TABLE hierarchy ADD COLUMN IF NOT EXISTS path TEXT;",
+            """
+            WITH RECURSIVE tree AS (
+                SELECT id, name::TEXT AS path FROM hierarchy WHERE parent_id IS NULL
+                UNION ALL
+                SELECT h.id, tree.path || '/' || h.name
+                FROM hierarchy h
+                JOIN tree ON h.parent_id = tree.id
+            )
+            UPDATE hierarchy h SET path = tree.path FROM tree WHERE h.id = tree.id;
+            """,
+            # Keep the path in sync on insert/move/rename (renames cascade to the children)
+            """
+            CREATE OR REPLACE FUNCTION hierarchy_set_path() RETURNS TRIGGER AS $$
+            BEGIN
+                NEW.path := COALESCE(
+                    (SELECT path || '/' FROM hierarchy WHERE id = NEW.parent_id), ''
+                ) || NEW.name;
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql;
+            """,
+            """
+            CREATE OR REPLACE FUNCTION hierarchy_cascade_path() RETURNS TRIGGER AS $$
+            BEGIN
+                IF NEW.path IS DISTINCT FROM OLD.path THEN
+                    UPDATE hierarchy SET name = name WHERE parent_id = NEW.id;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+            """,
+            """
+            CREATE TRIGGER hierarchy_set_path
+            BEFORE INSERT OR UPDATE OF name, parent_id ON hierarchy
+            FOR EACH ROW EXECUTE FUNCTION hierarchy_set_path();
+            """,
+            """
+            CREATE TRIGGER hierarchy_cascade_path
+            AFTER UPDATE OF name, parent_id ON hierarchy
+            FOR EACH ROW EXECUTE FUNCTION hierarchy_cascade_path();
+            """,
+            "ALTER TABLE hierarchy ALTER COLUMN path SET NOT NULL;",
+            # text_pattern_ops lets 'path LIKE prefix%' use the index
+            "CREATE INDEX IF NOT EXISTS hierarchy_path_idx ON hierarchy (path text_pattern_ops);",
+        ],
+    ),
+    (
+        3,
+        "change tracking (updated_at, change_xid, deleted_rows)",
+        change_tracking_statements("hierarchy", ["id"])
+        + change_tracking_statements("metrics", ["id"])
+        + change_tracking_statements("values", ["metric_id", "date"]),
+    ),
+]
 
-def create_eba_schema(cur):
-    """Basic schema creation without forcing constraints."""
+
+def create_eba_schema(cur, partitioned=False):
+    """
+    Creates the base tables and applies any pending EBA_MIGRATIONS.
+    With partitioned=True "values" is created (or converted) as a table partitioned by year.
+    """
     cur.execute(
         """
         CREATE TABLE IF NOT EXISTS hierarchy (
@@ -39,74 +151,261 @@ def create_eba_schema(cur):
         );
     """
     )
-    cur.execute(
+    if partitioned:
+        partition_values_table(cur)
+    else:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS values (
+                id SERIAL PRIMARY KEY,
+                date DATE NOT NULL,
+                value DOUBLE PRECISION,
+                metric_id INTEGER REFERENCES metrics(id),
+                value_meta JSONB,
+                UNIQUE(metric_id, date)
+            );
         """
-        CREATE TABLE IF NOT EXISTS values (
-            id SERIAL PRIMARY KEY,
-            date DATE NOT NULL,
-            value DOUBLE PRECISION,
-            metric_id INTEGER REFERENCES metrics(id),
-            value_meta JSONB,
-            UNIQUE(metric_id, date)
-        );
-    """
-    )
+        )
+    apply_migrations(cur, "eba", EBA_MIGRATIONS)
 
 
-def get_or_create_node(cur, name: str, parent_id: Optional[int]):
-    """Checks for existing hierarchy node to avoid duplicates."""
+# --- Yearly partitions of "values" ---
+# The unique key and primary key include the partition key (date), so every partition
+# gets its own UNIQUE(metric_id, date); a BRIN index on date keeps range scans cheap.
+PARTITIONED_VALUES_DDL = """
+    CREATE TABLE values (
+        id SERIAL,
+        date DATE NOT NULL,
+        value DOUBLE PRECISION,
+        metric_id INTEGER REFERENCES metrics(id),
+        value_meta JSONB,
+        PRIMARY KEY (id, date),
+        UNIQUE (metric_id, date)
+    ) PARTITION BY RANGE (date);
+"""
+
+
+def value_partitions(cur):
+    """Returns the years that already have a partition, or None if "values" is not partitioned."""
     cur.execute(
-        "SELECT id FROM hierarchy WHERE name = %s AND parent_id IS NOT DISTINCT FROM %s;",
-        (name, parent_id),
+        """
+        SELECT c.relkind,
+               ARRAY(SELECT inhrelid::regclass::TEXT FROM pg_inherits WHERE inhparent = c.oid)
+        FROM pg_class c
+        WHERE c.oid = to_regclass('values');
+    """
     )
     row = cur.fetchone()
-    if row:
-        return row[0]
+    if not row or row[0] != "p":
+        return None
+    return {int(name.rsplit("_y", 1)[1]) for name in row[1] if "_y" in name}
 
-    cur.execute(
-        "INSERT INTO hierarchy (name, parent_id) VALUES (%s, %s) RETURNING id;",
-        (name, parent_id),
-    )
-    return cur.fetchone()[0]
 
+def ensure_value_partitions(cur, years):
+    """
+    Creates the missing yearly partitions (values_y2024, ...) for 'years'.
+    A no-op for an unpartitioned table. Returns the years that were created.
+    """
+    existing = value_partitions(cur)
+    if existing is None:
+        return []
+    missing = sorted({int(y) for y in years} - existing)
+    if not missing:
+        return []
 
-def get_or_create_metric(cur, name: str, dimensions: dict, hierarchy_id: int):
+    # Concurrent loads may race for the same new year
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext('values_partitions'));")
+    for year in missing:
+        cur.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS values_y{year} PARTITION OF values
+            FOR VALUES FROM (%s) TO (%s);
+        """,
+            (f"{year}-01-01", f"{year + 1}-01-01"),
+        )
+    print(f"🧱 Created partitions of values for {', '.join(map(str, missing))}.")
+    return missing
+
+
+def partition_values_table(cur):
     """
-    Manual check for metric existence to avoid the ON CONFLICT error.
+    Creates "values" partitioned by year, or converts an existing unpartitioned table
+    (rows, ids and the id sequence are carried over inside the caller's transaction).
     """
-    cur.execute("SELECT id FROM metrics WHERE name = %s;", (name,))
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('values');")
     row = cur.fetchone()
+    if row and row[0] == "p":
+        return
 
+    views = []
     if row:
-        # Update existing record metadata
+        # 1. Move the old heap (and its index/sequence names) out of the way; the aggregate
+        # views depend on it, so they are rebuilt on the new table
+        views = drop_aggregate_views(cur)
+        cur.execute("ALTER TABLE values RENAME TO values_heap;")
+        cur.execute("ALTER INDEX IF EXISTS values_pkey RENAME TO values_heap_pkey;")
         cur.execute(
-            "UPDATE metrics SET dimensions = %s, hierarchy_id = %s WHERE id = %s;",
-            (json.dumps(dimensions), hierarchy_id, row[0]),
+            "ALTER INDEX IF EXISTS values_metric_id_date_key RENAME TO values_heap_metric_id_date_key;"
         )
-        return row[0]
-    else:
-        # Insert new record
+        cur.execute("ALTER INDEX IF EXISTS values_change_xid_idx RENAME TO values_heap_change_xid_idx;")
+        cur.execute("ALTER SEQUENCE IF EXISTS values_id_seq RENAME TO values_heap_id_seq;")
+
+    # 2. Partitioned table; the BRIN index on the parent is inherited by every partition
+    cur.execute(PARTITIONED_VALUES_DDL)
+    cur.execute("CREATE INDEX values_date_brin ON values USING brin (date);")
+
+    if row:
+        # 3. Copy the rows into their yearly partitions and continue the old id sequence
+        # (with their change tracking columns, so consumers' watermarks stay valid)
+        columns = "id, date, value, metric_id, value_meta"
+        if has_change_tracking(cur, "values_heap"):
+            enable_change_tracking(cur, "values", ["metric_id", "date"])
+            columns += ", updated_at, change_xid"
+        cur.execute("SELECT DISTINCT EXTRACT(YEAR FROM date)::INT FROM values_heap;")
+        ensure_value_partitions(cur, [r[0] for r in cur.fetchall()])
+        cur.execute(f"INSERT INTO values ({columns}) SELECT {columns} FROM values_heap;")
+        moved = cur.rowcount
         cur.execute(
-            "INSERT INTO metrics (name, dimensions, hierarchy_id) VALUES (%s, %s, %s) RETURNING id;",
-            (name, json.dumps(dimensions), hierarchy_id),
+            "SELECT setval('values_id_seq', COALESCE((SELECT MAX(id) FROM values), 0) + 1, false);"
         )
-        return cur.fetchone()[0]
+        cur.execute("DROP TABLE values_heap;")
+        print(f"🧱 Converted values to yearly partitions ({moved} rows moved).")
+        if views:
+            create_aggregate_views(cur)
+
+
+def load_existing_ids(cur):
+    """
+    Loads the current hierarchy and metrics tables into memory:
+    nodes keyed by (name, parent_id) and metrics keyed by name.
+    """
+    cur.execute("SELECT id, name, parent_id FROM hierarchy;")
+    nodes = {(name, parent_id): node_id for node_id, name, parent_id in cur.fetchall()}
+
+    cur.execute("SELECT id, name, dimensions, hierarchy_id FROM metrics;")
+    metrics = {
+        name: (metric_id, dimensions, hierarchy_id)
+        for metric_id, name, dimensions, hierarchy_id in cur.fetchall()
+    }
+    return nodes, metrics
 
 
 def sync_hierarchy(cur, data: Dict[str, Any], parent_id: Optional[int] = None):
-    """Recursively processes the YAML structure."""
-    for key, value in data.items():
-        if isinstance(value, dict):
-            node_id = get_or_create_node(cur, key, parent_id)
-            sync_hierarchy(cur, value, node_id)
-        else:
-            # Replaced ON CONFLICT with manual function
-            get_or_create_metric(cur, key, {"friendly_name": value}, parent_id)
-
-
-def run_setup():
-    if len(sys.argv) > 1:
-        target_db = sys.argv[1]
+    """
+    Diffs the YAML structure against the tables and only writes what changed.
+    Nodes are created level by level (children need their parent's id), metrics
+    are inserted and updated in batches. Returns a summary of the changes.
+    """
+    nodes, metrics = load_existing_ids(cur)
+    summary = {"nodes_created": 0, "metrics_created": 0, "metrics_updated": 0}
+    new_metrics, changed_metrics = [], []
+
+    level = [(parent_id, data)]
+    while level:
+        # 1. Create every missing node of this depth in one statement
+        missing = [
+            (key, pid)
+            for pid, section in level
+            for key, value in section.items()
+            if isinstance(value, dict) and (key, pid) not in nodes
+        ]
+        if missing:
+            created = execute_values(
+                cur,
+                "INSERT INTO hierarchy (name, parent_id) VALUES %s RETURNING id, name, parent_id;",
+                list(dict.fromkeys(missing)),
+                fetch=True,
+            )
+            for node_id, name, pid in created:
+                nodes[(name, pid)] = node_id
+            summary["nodes_created"] += len(created)
+
+        # 2. Compare metrics against what is already stored
+        next_level = []
+        for pid, section in level:
+            for key, value in section.items():
+                if isinstance(value, dict):
+                    next_level.append((nodes[(key, pid)], value))
+                    continue
+
+                dimensions = {"friendly_name": value}
+                existing = metrics.get(key)
+                if existing is None:
+                    new_metrics.append((key, Json(dimensions), pid))
+                elif existing[1] != dimensions or existing[2] != pid:
+                    changed_metrics.append((existing[0], Json(dimensions), pid))
+                metrics[key] = (existing[0] if existing else None, dimensions, pid)
+        level = next_level
+
+    # 3. Send the metric changes in batches
+    if new_metrics:
+        execute_values(
+            cur,
+            "INSERT INTO metrics (name, dimensions, hierarchy_id) VALUES %s;",
+            new_metrics,
+        )
+        summary["metrics_created"] = len(new_metrics)
+    if changed_metrics:
+        execute_values(
+            cur,
+            """
+            UPDATE metrics AS m
+            SET dimensions = v.dimensions, hierarchy_id = v.hierarchy_id
+            FROM (VALUES %s) AS v(id, dimensions, hierarchy_id)
+            WHERE m.id = v.id;
+            """,
+            changed_metrics,
+            template="(%s, %s::jsonb, %s::integer)",
+        )
+        summary["metrics_updated"] = len(changed_metrics)
+
+    print(
+        f"🌳 Hierarchy sync: {summary['nodes_created']} nodes created, "
+        f"{summary['metrics_created']} metrics created, "
+        f"{summary['metrics_updated']} metrics updated."
+    )
+    return summary
+
+
+YAML_PATH = Path(__file__).parent / "estructura_EBA.yaml"
+
+
+def sync_database(target_db=None, yaml_path=YAML_PATH, partitioned=False, aggregate_views=False):
+    """
+    Creates/migrates the schema and syncs the YAML tree into one database. Raises on error.
+    partitioned=True switches "values" to yearly partitions (see partition_values_table);
+    aggregate_views=True creates the materialized views of database.aggregations.
+    """
+    with pooled_connection(target_db=target_db) as (conn, cur):
+        try:
+            with span("create_schema"):
+                create_eba_schema(cur, partitioned)
+            with span("read_yaml"):
+                with open(yaml_path, "r", encoding="utf-8") as f:
+                    data = hierarchy_section(yaml.safe_load(f))
+            with span("sync_hierarchy"):
+                summary = sync_hierarchy(cur, data)
+            if aggregate_views:
+                create_aggregate_views(cur)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    invalidate(tables=["hierarchy", "metrics"])
+    print(f"✅ Metadata sync complete in '{target_db if target_db else 'default'}'.")
+    return summary
+
+
+def run_setup(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    partitioned = "--partitioned" in argv
+    aggregate_views = "--aggregate-views" in argv
+    args = [a for a in argv if not a.startswith("--")]
+    # Cron and other non-interactive runs use the default database instead of prompting
+    if args:
+        target_db = args[0]
+    elif not sys.stdin.isatty():
+        target_db = None
     else:
         target_db = input(
             "Choose database to update (leave blank for default): "
@@ -114,28 +413,18 @@ def run_setup():
         if not target_db:
             target_db = None
 
-    yaml_path = Path(__file__).parent / "estructura_EBA.yaml"
-    conn, cur = None, None
+    # Per-run report of stage timings and database round trips
+    recorder = get_instrumentation() or enable_instrumentation()
+    status = 0
     try:
-        conn, cur = get_db_connection(target_db=target_db)
-        create_eba_schema(cur)
-        with open(yaml_path, "r", encoding="utf-8") as f:
-            data = yaml.safe_load(f)
-        sync_hierarchy(cur, data)
-        conn.commit()
-        print(
-            f"✅ Metadata sync complete in '{target_db if target_db else 'default'}'."
-        )
+        sync_database(target_db, partitioned=partitioned, aggregate_views=aggregate_views)
     except Exception as e:
-        if conn:
-            conn.rollback()
         print(f"❌ Error during hierarchy sync: {e}")
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
+        status = 1
+    recorder.print_report()
+    recorder.flush()
+    return status
 
 
 if __name__ == "__main__":
-    run_setup()
+    sys.exit(run_setup())
@@ -1,6 +1,7 @@
 """
 This script processes the Excel file 'EBA_series_julian.xlsx' and uploads the data into the PostgreSQL database.
-It reads the hierarchical structure from 'estructura_EBA.yaml' and matches it with the Excel data.
+It reads the hierarchical structure from 'estructura_EBA.yaml' and matches it with the Excel data
+(the sheet layout comes from the 'mapping' section of that file, see mapping.py).
 The data is organized by date, country, and metric, and is inserted into the appropriate tables in the database.
 
 
@@ -15,8 +16,33 @@ SQL Query to join "values" and "metrics" tables:
         FROM values v
         JOIN metrics m
             ON v.metric_id = m.id;
+
+By default the whole sheet is reshaped in one vectorized pass and loaded through COPY into a
+temporary staging table, then merged into "values" with a single upsert. Pass --row-by-row to
+use the original per-period/per-metric path (kept for comparison):
+
+        python upload_series_EBA.py [target_db] [--row-by-row]
+
+Incremental refreshes only send periods newer than each metric's latest stored date
+(--check-changes also re-checks older rows for changed values; --dry-run only prints counts):
+
+        python upload_series_EBA.py [target_db] --incremental [--check-changes] [--dry-run]
+
+The parsed sheet is cached under series_EBA/.cache while the workbook is unchanged
+(--no-cache forces a fresh read).
+
+Long loads can be committed in chunks, one per period or every N rows. Completed chunks are
+recorded in "upload_checkpoints", so rerunning a failed load resumes where it stopped:
+
+        python upload_series_EBA.py [target_db] --chunk period
+        python upload_series_EBA.py [target_db] --chunk 50000
+
+Rows that can't be loaded (unparseable values, invalid periods, duplicates) are written
+to series_EBA/rejected/ instead of being dropped silently.
 """
 
+import io
+import hashlib
 import pandas as pd
 import json
 import yaml
@@ -28,48 +54,456 @@ from datetime import datetime
 BASE_DIR = Path(__file__).resolve().parent.parent
 sys.path.append(str(BASE_DIR))
 
-from database.connection import get_db_connection
+from database.connection import pooled_connection
+from database.cache import invalidate
+from database.aggregations import refresh_aggregate_views
+from database.instrumentation import span, get_instrumentation, enable_instrumentation
+from series_EBA.workbook_cache import WorkbookCache
+from series_EBA.mapping import REJECT_COLUMNS, load_mapping, hierarchy_section
+from series_EBA.series_hierarchy_metric_EBA import ensure_value_partitions
 
 
-def upload_values(df_chunk, cur, yaml_section, date):
-    """Matches YAML metrics against Excel rows and uploads values."""
+def upload_values(df_chunk, cur, yaml_section, date, rejected=None):
+    """
+    Matches YAML metrics against Excel rows and uploads values.
+    Values that can't be parsed and metrics missing from the database are appended to
+    'rejected' (when given) instead of being dropped silently.
+    """
     for key, val in yaml_section.items():
         if isinstance(val, dict):
-            upload_values(df_chunk, cur, val, date)
+            upload_values(df_chunk, cur, val, date, rejected)
         else:
             parts = key.split(".")
             metric_name, country_code = parts[1], parts[2]
             try:
                 raw_val = df_chunk.loc[(country_code, metric_name), "valor"]
+            except KeyError:
+                # No row for this metric/country in this period
+                continue
+            try:
                 # Convert percentages/strings or NumPy types to native Python float
                 clean_val = (
                     float(raw_val.replace(",", ".").replace("%", "")) / 100
                     if isinstance(raw_val, str)
                     else float(raw_val)
                 )
+            except ValueError:
+                _reject(rejected, key, date, raw_val, "unparseable value")
+                continue
+
+            if np.isnan(clean_val):
+                continue
+
+            cur.execute("SELECT id FROM metrics WHERE name = %s", (key,))
+            m_id = cur.fetchone()
+            if not m_id:
+                _reject(rejected, key, date, raw_val, "metric not in database")
+                continue
+            cur.execute(
+                """
+                INSERT INTO values (date, value, metric_id, value_meta)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (metric_id, date) DO UPDATE SET value = EXCLUDED.value;
+            """,
+                (date, clean_val, m_id[0], json.dumps({})),
+            )
+
+
+def _reject(rejected, name, date, raw_value, reason):
+    if rejected is not None:
+        rejected.append(
+            {"name": name, "period": date.strftime("%Y%m"), "raw_value": raw_value, "reason": reason}
+        )
+
+
+def reshape_values(df, plan=None):
+    """
+    Vectorized reshape of the raw sheet into one row per (metric name, date, value),
+    following the sheet layout in the 'mapping' section of estructura_EBA.yaml.
+    With the EBA layout it mirrors upload_values(): strings like '6,5%' are divided by
+    100, numbers are taken as they are and empty values are dropped.
+    """
+    return reshape_with_rejects(df, plan)[0]
+
+
+def reshape_with_rejects(df, plan=None):
+    """
+    reshape_values() that also returns the rows it could not use as a DataFrame of
+    (name, period, raw_value, reason), see mapping.LoadPlan.apply. 'plan' defaults to
+    the mapping of SHEET_NAME.
+    """
+    if plan is None:
+        plan = load_mapping(YAML_FILE).plan_for(SHEET_NAME)
+        if plan is None:
+            raise ValueError(f"The mapping in {YAML_FILE.name} has no layout for '{SHEET_NAME}'")
+    return plan.apply(df)
+
+
+def load_watermarks(cur):
+    """Returns the latest stored date per metric_id as a DataFrame."""
+    cur.execute("SELECT metric_id, MAX(date) FROM values GROUP BY metric_id;")
+    return pd.DataFrame(cur.fetchall(), columns=["metric_id", "watermark"])
+
+
+def load_metric_ids(cur):
+    """Returns the metrics table as a (metric_id, name) DataFrame for joins."""
+    cur.execute("SELECT id AS metric_id, name FROM metrics;")
+    return pd.DataFrame(cur.fetchall(), columns=["metric_id", "name"])
+
+
+def copy_and_merge(cur, records, dry_run=False):
+    """
+    Streams (date, value, metric_id) records through COPY into a temporary staging
+    table and merges them into "values" with one upsert that skips unchanged rows.
+    Returns (inserted, updated); with dry_run nothing is written, only counted.
+    """
+    # 1. Stream the rows into a temporary staging table
+    cur.execute(
+        """
+        CREATE TEMP TABLE IF NOT EXISTS values_staging (
+            date DATE NOT NULL,
+            value DOUBLE PRECISION,
+            metric_id INTEGER NOT NULL
+        ) ON COMMIT DROP;
+    """
+    )
+    buffer = io.StringIO()
+    records[["date", "value", "metric_id"]].to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cur.copy_expert(
+        "COPY values_staging (date, value, metric_id) FROM STDIN WITH (FORMAT csv)",
+        buffer,
+    )
+
+    # 2. Merge into the real table in a single statement (or just count for a dry run)
+    if dry_run:
+        cur.execute(
+            """
+            SELECT COUNT(*) FILTER (WHERE v.metric_id IS NULL),
+                   COUNT(*) FILTER (WHERE v.metric_id IS NOT NULL
+                                      AND v.value IS DISTINCT FROM s.value)
+            FROM values_staging s
+            LEFT JOIN values v ON v.metric_id = s.metric_id AND v.date = s.date;
+        """
+        )
+    else:
+        # Partitioned "values": add the yearly partitions these rows land in
+        ensure_value_partitions(cur, pd.to_datetime(records["date"]).dt.year.unique())
+        cur.execute(
+            """
+            WITH merged AS (
+                INSERT INTO values (date, value, metric_id, value_meta)
+                SELECT date, value, metric_id, %s::jsonb FROM values_staging
+                ON CONFLICT (metric_id, date) DO UPDATE SET value = EXCLUDED.value
+                WHERE values.value IS DISTINCT FROM EXCLUDED.value
+                RETURNING metric_id, date
+            )
+            -- The join sees "values" as it was before the upsert: no match means inserted
+            -- (RETURNING xmax is not available on partitioned tables)
+            SELECT COUNT(*) FILTER (WHERE v.metric_id IS NULL),
+                   COUNT(*) FILTER (WHERE v.metric_id IS NOT NULL)
+            FROM merged m
+            LEFT JOIN values v ON v.metric_id = m.metric_id AND v.date = m.date;
+        """,
+            (json.dumps({}),),
+        )
+    inserted, updated = cur.fetchone()
+    cur.execute("TRUNCATE values_staging;")
+    return inserted, updated
+
+
+def _drop_before_watermarks(cur, records, counts):
+    """Incremental mode: drops history at or before each metric's watermark (counted as skipped)."""
+    # Keeps the index of 'records' (chunked uploads select their rows by it)
+    watermarks = records.merge(load_watermarks(cur), on="metric_id", how="left")["watermark"]
+    watermarks.index = records.index
+    is_new = watermarks.isna() | (records["date"] > watermarks)
+    counts["skipped"] += int((~is_new).sum())
+    return records[is_new]
+
+
+def bulk_upload_values(df, cur, incremental=False, check_changes=False, dry_run=False):
+    """
+    Loads the whole sheet with one COPY into a staging table and one set-based upsert.
+    Rows whose stored value is already identical are skipped by the upsert.
+
+    incremental: only send periods after each metric's latest stored date (its watermark).
+    check_changes: with incremental, also send older rows so changed values get updated.
+    dry_run: only count what would change; nothing is written to "values".
+
+    Returns a dict with the inserted, updated and skipped row counts, the metric ids
+    that were sent (used to invalidate cached reads) and the rejected rows.
+    """
+    counts = {"inserted": 0, "updated": 0, "skipped": 0, "metric_ids": []}
+
+    # 1. Reshape and map metric names to ids with a join (metrics outside the YAML are dropped)
+    with span("reshape"):
+        records, counts["rejected"] = reshape_with_rejects(df)
+        records = records.merge(load_metric_ids(cur), on="name", how="inner")
+
+    # 2. Incremental mode: drop history at or before each metric's watermark
+    if incremental and not check_changes:
+        records = _drop_before_watermarks(cur, records, counts)
+    if records.empty:
+        return counts
+
+    # 3. COPY + one set-based upsert
+    counts["metric_ids"] = [int(m) for m in records["metric_id"].unique()]
+    with span("load"):
+        inserted, updated = copy_and_merge(cur, records, dry_run)
+    counts["inserted"] += inserted
+    counts["updated"] += updated
+    counts["skipped"] += len(records) - inserted - updated
+    return counts
+
+
+# --- Chunked, resumable loads ---
+# Each chunk is committed together with its row in upload_checkpoints, so a failed run
+# can be restarted and skips the chunks that already made it. A run is identified by
+# the source name plus a hash of its records; its checkpoints are removed once it finishes.
+CHECKPOINTS_DDL = """
+    CREATE TABLE IF NOT EXISTS upload_checkpoints (
+        run_key TEXT NOT NULL,
+        chunk TEXT NOT NULL,
+        rows INTEGER NOT NULL,
+        inserted INTEGER NOT NULL,
+        updated INTEGER NOT NULL,
+        completed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (run_key, chunk)
+    );
+"""
+
+
+def run_key(source, frame):
+    """Identifies one load of 'frame' from 'source' (changes whenever the data changes)."""
+    digest = hashlib.sha1(pd.util.hash_pandas_object(frame, index=False).values.tobytes())
+    return f"{source}:{digest.hexdigest()[:16]}"
+
+
+def load_checkpoints(cur, key):
+    """Creates the checkpoint table if needed and returns the chunks already done for 'key'."""
+    cur.execute(CHECKPOINTS_DDL)
+    cur.execute("SELECT chunk FROM upload_checkpoints WHERE run_key = %s;", (key,))
+    return {row[0] for row in cur.fetchall()}
+
+
+def save_checkpoint(cur, key, chunk, rows, inserted=0, updated=0):
+    cur.execute(
+        """
+        INSERT INTO upload_checkpoints (run_key, chunk, rows, inserted, updated)
+        VALUES (%s, %s, %s, %s, %s);
+    """,
+        (key, chunk, rows, inserted, updated),
+    )
+
+
+def iter_chunks(records, chunk_size):
+    """Yields (chunk id, rows): one chunk per period for chunk_size="period", else every N rows."""
+    if chunk_size == "period":
+        for date, group in records.groupby("date", sort=True):
+            yield str(date), group
+        return
+    chunk_size = int(chunk_size)
+    for start in range(0, len(records), chunk_size):
+        stop = min(start + chunk_size, len(records))
+        yield f"rows {start}-{stop - 1}", records.iloc[start:stop]
+
+
+def chunked_upload_values(conn, cur, df, chunk_size, incremental=False, check_changes=False, source=None):
+    """
+    bulk_upload_values() that commits every chunk (see iter_chunks) with a checkpoint.
+    Rerunning after a failure with the same data resumes after the last committed chunk.
+    Returns the same counts plus the number of chunks loaded and resumed.
+    """
+    counts = {"inserted": 0, "updated": 0, "skipped": 0, "metric_ids": [], "chunks": 0, "resumed": 0}
+
+    with span("reshape"):
+        records, counts["rejected"] = reshape_with_rejects(df)
+        records = records.merge(load_metric_ids(cur), on="name", how="inner")
+        records = records.sort_values(["date", "name"], ignore_index=True)
+
+    # The key is taken before the watermark filter, which shrinks as chunks get committed
+    key = run_key(source or DATA_FILE.name, records)
+    done = load_checkpoints(cur, key)
+    conn.commit()
+    if done:
+        print(f"⏩ Resuming run {key}: {len(done)} chunks already loaded.")
+
+    # Chunks (and their checkpoint ids) come from the full record set; the watermark filter
+    # is applied inside each chunk, so a resumed run numbers its chunks like the first one
+    send = records
+    if incremental and not check_changes:
+        send = _drop_before_watermarks(cur, records, counts)
+
+    metric_ids = set()
+    with span("load"):
+        for chunk, chunk_rows in iter_chunks(records, chunk_size):
+            if chunk in done:
+                counts["resumed"] += 1
+                continue
+            rows = send.loc[send.index.intersection(chunk_rows.index)]
+            try:
+                inserted, updated = copy_and_merge(cur, rows) if len(rows) else (0, 0)
+                save_checkpoint(cur, key, chunk, len(rows), inserted, updated)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                print(f"❌ Chunk {chunk} failed; rerun to resume from it.")
+                raise
+            chunk_ids = [int(m) for m in rows["metric_id"].unique()]
+            invalidate(metric_ids=chunk_ids)
+            metric_ids.update(chunk_ids)
+            counts["chunks"] += 1
+            counts["inserted"] += inserted
+            counts["updated"] += updated
+            counts["skipped"] += len(rows) - inserted - updated
+
+    # Finished: the next run of the same data starts from scratch
+    cur.execute("DELETE FROM upload_checkpoints WHERE run_key = %s;", (key,))
+    conn.commit()
+    counts["metric_ids"] = sorted(metric_ids)
+    return counts
+
+
+REJECTS_DIR = Path(__file__).parent / "rejected"
+
+
+def write_rejects_report(rejected, target_db=None):
+    """Writes the rejected rows to series_EBA/rejected/*.csv and prints a summary by reason."""
+    if rejected is None or len(rejected) == 0:
+        return None
+    REJECTS_DIR.mkdir(exist_ok=True)
+    path = REJECTS_DIR / f"rejected_{target_db or 'default'}_{datetime.now():%Y%m%d_%H%M%S}.csv"
+    rejected.to_csv(path, index=False)
+    by_reason = ", ".join(f"{n} {reason}" for reason, n in rejected["reason"].value_counts().items())
+    print(f"⚠️ {len(rejected)} rows rejected ({by_reason}): see {path}")
+    return path
+
+
+DATA_FILE = Path(__file__).parent / "excels_raw_EBA" / "EBA_series_julian.xlsx"
+YAML_FILE = Path(__file__).parent / "estructura_EBA.yaml"
+SHEET_NAME = "KRIs_by_country_and_EU"
+
+
+def read_source(use_cache=True):
+    """Reads the EBA sheet (through the parsed-workbook cache unless use_cache is False)."""
+    print("📖 Reading Excel...")
+    with span("read_excel"):
+        if use_cache:
+            # Reuses the parsed sheet while the workbook is unchanged
+            return WorkbookCache().get_or_parse(
+                DATA_FILE, SHEET_NAME, lambda p: pd.read_excel(p, sheet_name=SHEET_NAME)
+            )
+        return pd.read_excel(DATA_FILE, sheet_name=SHEET_NAME)
+
+
+def upload_database(
+    target_db,
+    df,
+    row_by_row=False,
+    incremental=False,
+    check_changes=False,
+    dry_run=False,
+    chunk_size=None,
+):
+    """
+    Uploads the sheet into one target database. Raises on error.
+    chunk_size ("period" or a number of rows) commits chunk by chunk with checkpoints, so
+    a failed run can be rerun and resumes where it stopped (row-by-row chunks per period).
+    Rows that can't be loaded are written to a rejected-rows report.
+    """
+    counts = None
+    chunked = bool(chunk_size) and not dry_run
+    with pooled_connection(target_db=target_db) as (conn, cur):
+        try:
+            if row_by_row:
+                with open(YAML_FILE, "r", encoding="utf-8") as f:
+                    yaml_data = hierarchy_section(yaml.safe_load(f))
+                key = run_key(DATA_FILE.name, df) if chunked else None
+                done = load_checkpoints(cur, key) if chunked else set()
+                df = df.set_index(["periodo", "pais", "metric"])
+                periods = df.index.get_level_values("periodo").unique()
+                ensure_value_partitions(cur, {int(str(p)[:4]) for p in periods})
+                rejected = []
+                with span("load"):
+                    for p in periods:
+                        if str(p) in done:
+                            continue
+                        dt = datetime.strptime(str(p), "%Y%m").date()
+                        print(f"🚀 Processing: {dt}")
+                        upload_values(df.loc[p], cur, yaml_data, dt, rejected)
+                        if chunked:
+                            save_checkpoint(cur, key, str(p), len(df.loc[p]))
+                            conn.commit()
+                            invalidate(tables=["values"])
+                if chunked:
+                    cur.execute("DELETE FROM upload_checkpoints WHERE run_key = %s;", (key,))
+                counts = {"rejected": pd.DataFrame(rejected, columns=REJECT_COLUMNS)}
+            elif chunked:
+                print(f"🚀 Bulk loading through COPY in chunks ({chunk_size})...")
+                counts = chunked_upload_values(conn, cur, df, chunk_size, incremental, check_changes)
+                print(
+                    f"📦 {counts['inserted']} inserted, {counts['updated']} updated, "
+                    f"{counts['skipped']} skipped in {counts['chunks']} chunks "
+                    f"({counts['resumed']} already loaded)."
+                )
+            else:
+                print("🚀 Bulk loading through COPY...")
+                counts = bulk_upload_values(df, cur, incremental, check_changes, dry_run)
+                print(
+                    f"📦 {counts['inserted']} inserted, {counts['updated']} updated, "
+                    f"{counts['skipped']} skipped."
+                )
+            write_rejects_report(counts["rejected"], target_db)
+            if dry_run:
+                conn.rollback()
+                print("🧪 Dry run: no changes were written.")
+                return counts
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    # Refresh the aggregate views (if any) before cached reads are dropped
+    with pooled_connection(target_db=target_db) as (conn, cur):
+        try:
+            with span("refresh_views"):
+                refresh_aggregate_views(cur)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"⚠️ Could not refresh aggregate views: {e}")
 
-                if np.isnan(clean_val):
-                    continue
-
-                cur.execute("SELECT id FROM metrics WHERE name = %s", (key,))
-                m_id = cur.fetchone()
-                if m_id:
-                    cur.execute(
-                        """
-                        INSERT INTO values (date, value, metric_id, value_meta)
-                        VALUES (%s, %s, %s, %s)
-                        ON CONFLICT (metric_id, date) DO UPDATE SET value = EXCLUDED.value;
-                    """,
-                        (date, clean_val, m_id[0], json.dumps({})),
-                    )
-            except (KeyError, ValueError):
-                pass
-
-
-def main():
-    # INTERACTIVE MODE: Ask for database if not provided as argument
-    if len(sys.argv) > 1:
-        target_db = sys.argv[1]
+    # Drop cached reads of the series that were just written
+    if row_by_row:
+        invalidate(tables=["values"])
+    else:
+        invalidate(metric_ids=counts["metric_ids"])
+    print(f"✅ Data upload complete in '{target_db if target_db else 'default'}'.")
+    return counts
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    # --row-by-row keeps the original per-period path for comparison
+    row_by_row = "--row-by-row" in argv
+    incremental = "--incremental" in argv
+    check_changes = "--check-changes" in argv
+    dry_run = "--dry-run" in argv
+    use_cache = "--no-cache" not in argv
+    # --chunk period | --chunk N: commit per period / every N rows and resume failed runs
+    chunk_size = None
+    if "--chunk" in argv:
+        index = argv.index("--chunk")
+        chunk_size = argv[index + 1]
+        del argv[index : index + 2]
+    args = [a for a in argv if not a.startswith("--")]
+
+    # INTERACTIVE MODE: Ask for database if not provided as argument (cron runs use the default)
+    if args:
+        target_db = args[0]
+    elif not sys.stdin.isatty():
+        target_db = None
     else:
         target_db = input(
             "Choose database to update (leave blank for default): "
@@ -77,37 +511,21 @@ def main():
         if not target_db:
             target_db = None
 
-    current_dir = Path(__file__).parent
-    data_file = current_dir / "excels_raw_EBA" / "EBA_series_julian.xlsx"
-    yaml_file = current_dir / "estructura_EBA.yaml"
-
-    with open(yaml_file, "r", encoding="utf-8") as f:
-        yaml_data = yaml.safe_load(f)
-
-    print("📖 Reading Excel...")
-    df = pd.read_excel(data_file, sheet_name="KRIs_by_country_and_EU")
-    df = df.set_index(["periodo", "pais", "metric"])
-
-    conn, cur = None, None
+    # Per-run report of stage timings and database round trips
+    recorder = get_instrumentation() or enable_instrumentation()
+    df = read_source(use_cache)
+    status = 0
     try:
-        conn, cur = get_db_connection(target_db=target_db)
-        periods = df.index.get_level_values("periodo").unique()
-        for p in periods:
-            dt = datetime.strptime(str(p), "%Y%m").date()
-            print(f"🚀 Processing: {dt}")
-            upload_values(df.loc[p], cur, yaml_data, dt)
-        conn.commit()
-        print(f"✅ Data upload complete in '{target_db if target_db else 'default'}'.")
+        upload_database(
+            target_db, df, row_by_row, incremental, check_changes, dry_run, chunk_size
+        )
     except Exception as e:
-        if conn:
-            conn.rollback()
         print(f"❌ Error: {e}")
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
+        status = 1
+    recorder.print_report()
+    recorder.flush()
+    return status
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
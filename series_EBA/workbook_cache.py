@@ -0,0 +1,144 @@
+"""
+Local cache of parsed workbooks, so unchanged Excel files are not parsed again by openpyxl.
+
+Entries are keyed by file path + a 'variant' (e.g. the sheet name) and validated with the
+file's size, mtime and SHA-256 content hash. Frames are stored as uncompressed Arrow IPC
+(Feather) files and memory-mapped on load when pyarrow is installed, with pickle as the
+fallback. The cache directory is capped in size and evicts least-recently-used entries.
+
+    cache = WorkbookCache()
+    df = cache.get_or_parse(path, "KRIs_by_country_and_EU",
+                            lambda p: pd.read_excel(p, sheet_name="KRIs_by_country_and_EU"))
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import pandas as pd
+from pathlib import Path
+
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+CACHE_DIR = Path(__file__).parent / ".cache"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class WorkbookCache:
+    """Parsed-DataFrame cache with LRU eviction under a byte cap."""
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.index_path = self.cache_dir / "index.json"
+        self.hits = 0
+        self.misses = 0
+
+    # --- index handling (written atomically; a lost update only costs a re-parse) ---
+    def _read_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write_index(self, index):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+    # --- frame storage ---
+    def _load_frame(self, entry):
+        data_path = self.cache_dir / entry["file"]
+        if not data_path.exists():
+            return None
+        if entry["format"] == "feather":
+            if feather is None:
+                return None
+            return feather.read_table(data_path, memory_map=True).to_pandas()
+        return pd.read_pickle(data_path)
+
+    def _store_frame(self, df, stem):
+        """Writes the frame as Feather when possible (mixed-type columns fall back to pickle)."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        if feather is not None:
+            data_path = self.cache_dir / f"{stem}.feather"
+            try:
+                feather.write_feather(
+                    df.reset_index(drop=True), data_path, compression="uncompressed"
+                )
+                return data_path, "feather"
+            except Exception:
+                data_path.unlink(missing_ok=True)
+        data_path = self.cache_dir / f"{stem}.pkl"
+        df.to_pickle(data_path)
+        return data_path, "pickle"
+
+    def _evict(self, index):
+        """Drops least-recently-used entries until the cache fits in max_bytes."""
+        total = sum(entry["bytes"] for entry in index.values())
+        for key, entry in sorted(index.items(), key=lambda item: item[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            (self.cache_dir / entry["file"]).unlink(missing_ok=True)
+            total -= entry["bytes"]
+            del index[key]
+
+    def get_or_parse(self, path, variant, parse):
+        """Returns the cached frame for (path, variant), calling parse(path) on a miss."""
+        path = Path(path).resolve()
+        stat = path.stat()
+        key = f"{path}::{variant}"
+        index = self._read_index()
+        entry = index.get(key)
+
+        # 1. Same size and mtime: trust the stored hash; otherwise re-hash the file
+        digest = None
+        if entry and (entry["size"], entry["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+            digest = file_sha256(path)
+            if digest != entry["sha256"]:
+                entry = None
+
+        if entry:
+            df = self._load_frame(entry)
+            if df is not None:
+                self.hits += 1
+                entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns, last_used=time.time())
+                self._write_index(index)
+                return df
+
+        # 2. Miss: parse, store and evict old entries if over the cap
+        self.misses += 1
+        df = parse(path)
+        digest = digest or file_sha256(path)
+        stem = f"{digest[:16]}_{re.sub(r'[^A-Za-z0-9_.-]', '_', str(variant))}"
+        data_path, fmt = self._store_frame(df, stem)
+        if entry := index.get(key):
+            if entry["file"] != data_path.name:
+                (self.cache_dir / entry["file"]).unlink(missing_ok=True)
+        index[key] = {
+            "file": data_path.name,
+            "format": fmt,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": digest,
+            "bytes": data_path.stat().st_size,
+            "last_used": time.time(),
+        }
+        self._evict(index)
+        self._write_index(index)
+        return df
@@ -0,0 +1,72 @@
+# Shared fixtures for the tests
+#
+# Tests that need PostgreSQL run against the database named by TEST_DATABASE (on the server
+# of config/database.yaml, or of DB_CONFIG_PATH) and are skipped when it is not set. The
+# EBA tables of that database are dropped and recreated: point it at a scratch database.
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+
+
+@pytest.fixture(scope="session")
+def test_db():
+    """Name of the scratch database, after checking that it accepts connections."""
+    name = os.getenv("TEST_DATABASE")
+    if not name:
+        pytest.skip("TEST_DATABASE is not set")
+
+    from database.connection import pooled_connection
+
+    try:
+        with pooled_connection(target_db=name) as (conn, cur):
+            cur.execute("SELECT 1;")
+    except Exception as e:
+        pytest.skip(f"Cannot connect to '{name}': {e}")
+    return name
+
+
+# Small EBA tree: one metric code with core and southern countries under different nodes
+EBA_TREE = {
+    "EBA_Metrics": {
+        "NPE_ratio": {
+            "Core": {"EBA.NPE_ratio.DE": "DE", "EBA.NPE_ratio.FR": "FR", "EBA.NPE_ratio.EU": "EU"},
+            "South": {"EBA.NPE_ratio.ES": "ES", "EBA.NPE_ratio.IT": "IT", "EBA.NPE_ratio.PT": "PT"},
+        }
+    }
+}
+
+EBA_TABLES = [
+    "values", "metrics", "hierarchy", "schema_migrations",
+    "deleted_rows", "upload_checkpoints", "change_watermarks",
+]
+
+
+@pytest.fixture(scope="session")
+def eba_db(test_db):
+    """The scratch database with a fresh EBA schema, EBA_TREE, 8 quarters of values and views."""
+    from psycopg2.extras import execute_values
+    from database.connection import pooled_connection
+    from database.aggregations import create_aggregate_views
+    from series_EBA.series_hierarchy_metric_EBA import create_eba_schema, sync_hierarchy
+
+    with pooled_connection(target_db=test_db) as (conn, cur):
+        cur.execute(f"DROP TABLE IF EXISTS {', '.join(EBA_TABLES)} CASCADE;")
+        create_eba_schema(cur)
+        sync_hierarchy(cur, EBA_TREE)
+        cur.execute("SELECT id, name FROM metrics ORDER BY name;")
+        metrics = cur.fetchall()
+        rows = [
+            (metric_id, f"{2022 + quarter // 4}-{3 * (quarter % 4) + 1:02d}-01", (i + 1) * 1.5 + quarter)
+            for i, (metric_id, _) in enumerate(metrics)
+            for quarter in range(8)
+        ]
+        execute_values(cur, "INSERT INTO values (metric_id, date, value) VALUES %s;", rows)
+        create_aggregate_views(cur)
+        conn.commit()
+    return test_db
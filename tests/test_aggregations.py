@@ -0,0 +1,26 @@
+import pandas as pd
+
+from database.aggregations import cross_country_stats
+
+SOUTH = "EBA_Metrics/NPE_ratio/South/*"
+
+
+def _sorted(df):
+    return df.sort_values(["metric", "date"]).reset_index(drop=True)
+
+
+def test_cross_country_stats_view_matches_live(eba_db):
+    live = _sorted(cross_country_stats(target_db=eba_db))
+    view = _sorted(cross_country_stats(use_views=True, target_db=eba_db))
+
+    assert live["countries"].eq(5).all()
+    pd.testing.assert_frame_equal(view[live.columns], live, check_dtype=False)
+
+
+def test_cross_country_stats_path_filter_ignores_view(eba_db):
+    live = _sorted(cross_country_stats(path=SOUTH, target_db=eba_db))
+    view = _sorted(cross_country_stats(path=SOUTH, use_views=True, target_db=eba_db))
+
+    # Only ES, IT and PT are under South; the view would count all five countries
+    assert live["countries"].eq(3).all()
+    pd.testing.assert_frame_equal(view, live)
@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+from database.connection import pooled_connection
+from exports.writers import frame_from_cursor, write_frame
+
+
+def test_parquet_round_trip_with_jsonb(test_db, tmp_path):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+
+    with pooled_connection(target_db=test_db) as (conn, cur):
+        cur.execute(
+            """
+            CREATE TEMP TABLE json_export (id INTEGER, date DATE, meta JSONB, doc JSON);
+            INSERT INTO json_export VALUES
+                (1, '2024-03-31', '{}', '[1, 2]'),
+                (2, '2024-06-30', '{"source": "EBA", "flags": ["p"]}', NULL),
+                (3, '2024-09-30', NULL, '{"ñ": 1}');
+        """
+        )
+        cur.execute("SELECT * FROM json_export ORDER BY id;")
+        df = frame_from_cursor(cur.fetchall(), cur.description)
+        conn.rollback()
+
+    path = write_frame(df, tmp_path / "json_export", fmt="parquet")
+    back = pd.read_parquet(path)
+
+    # JSON columns come back as text (jsonb may reorder keys, so compare parsed values)
+    assert [json.loads(v) for v in back["meta"][:2]] == [{}, {"source": "EBA", "flags": ["p"]}]
+    assert back["doc"].tolist()[::2] == ["[1, 2]", '{"ñ": 1}']
+    assert back["meta"].isna().tolist() == [False, False, True]
+    assert str(back["id"].dtype) == "Int64"